@@ -0,0 +1,282 @@
+#micro benchmarks for the engine pieces: python benchmarks.py
+#(importing main.py needs the libtcod library, but only running it as the game opens a window)
+import math
+import random
+import sys
+import timeit
+
+import carving
+
+
+class _Rect:
+	def __init__(self, x, y, w, h):
+		self.x1 = x
+		self.y1 = y
+		self.x2 = x + w
+		self.y2 = y + h
+
+	def center(self):
+		return ((self.x1 + self.x2) // 2, (self.y1 + self.y2) // 2)
+
+
+class _Tile:
+	def __init__(self, blocked):
+		self.blocked = blocked
+		self.block_sight = blocked
+
+
+def _layout(width, height, rooms, seed=1):
+	#the same rooms-and-tunnels plan for both carvers
+	rng = random.Random(seed)
+	plan = []
+	prev = None
+	for i in range(rooms):
+		w = rng.randint(6, 10)
+		h = rng.randint(6, 10)
+		room = _Rect(rng.randint(1, width - w - 2), rng.randint(1, height - h - 2), w, h)
+		plan.append(('circle' if rng.randint(0, 1) else 'rect', room, prev, rng.randint(0, 1)))
+		prev = room
+	return plan
+
+
+def _carve_tiles(width, height, plan):
+	#the old way: set two attributes per tile in nested loops
+	grid = [[_Tile(True) for y in range(height)] for x in range(width)]
+	for (shape, room, prev, coin) in plan:
+		if shape == 'rect':
+			for x in range(room.x1 + 1, room.x2):
+				for y in range(room.y1 + 1, room.y2):
+					grid[x][y].blocked = False
+					grid[x][y].block_sight = False
+		else:
+			(cx, cy) = room.center()
+			r = min(room.x2 - room.x1, room.y2 - room.y1) / 1.8
+			for x in range(room.x1, room.x2 + 1):
+				for y in range(room.y1, room.y2 + 1):
+					if math.sqrt((x - cx) ** 2 + (y - cy) ** 2) <= r:
+						grid[x][y].blocked = False
+						grid[x][y].block_sight = False
+		if prev is not None:
+			((x1, y1), (x2, y2)) = (prev.center(), room.center())
+			(hy, vx) = (y1, x2) if coin else (y2, x1)
+			for x in range(min(x1, x2), max(x1, x2) + 1):
+				grid[x][hy].blocked = False
+				grid[x][hy].block_sight = False
+			for y in range(min(y1, y2), max(y1, y2) + 1):
+				grid[vx][y].blocked = False
+				grid[vx][y].block_sight = False
+	return grid
+
+
+def _carve_mask(width, height, plan):
+	mask = carving.Mask(width, height)
+	for (shape, room, prev, coin) in plan:
+		if shape == 'rect':
+			mask.room(room)
+		else:
+			mask.circular_room(room)
+		if prev is not None:
+			((x1, y1), (x2, y2)) = (prev.center(), room.center())
+			(hy, vx) = (y1, x2) if coin else (y2, x1)
+			mask.h_tunnel(x1, x2, hy)
+			mask.v_tunnel(y1, y2, vx)
+	return mask
+
+
+def bench_carving(width=512, height=512, rooms=2000, repeat=3):
+	plan = _layout(width, height, rooms)
+
+	#both carvers must agree before the timings mean anything
+	grid = _carve_tiles(width, height, plan)
+	mask = _carve_mask(width, height, plan)
+	for x in range(width):
+		for y in range(height):
+			assert grid[x][y].blocked != mask.is_floor(x, y), (x, y)
+
+	#carving only: the tile grid is built up front for the old way, like make_map() used to
+	tiles = min(timeit.repeat(lambda: _carve_tiles(width, height, plan), number=1, repeat=repeat))
+	build = min(timeit.repeat(lambda: [[_Tile(True) for y in range(height)] for x in range(width)], number=1, repeat=repeat))
+	masks = min(timeit.repeat(lambda: _carve_mask(width, height, plan), number=1, repeat=repeat))
+	print('carving %d rooms on %dx%d: per tile %.1f ms, mask %.1f ms (%.0fx)' %
+		  (rooms, width, height, (tiles - build) * 1000, masks * 1000, (tiles - build) / masks))
+
+
+def _footprint(obj):
+	#bytes held by an instance itself, plus its __dict__ if it has one
+	size = sys.getsizeof(obj)
+	if hasattr(obj, '__dict__'):
+		size += sys.getsizeof(obj.__dict__)
+	return size
+
+
+class _Plain:
+	pass
+
+
+def _unslotted(obj):
+	#the same attributes in a plain instance, i.e. what the entity cost before __slots__
+	plain = _Plain()
+	for (name, value) in obj.__getstate__().items():
+		setattr(plain, name, value)
+	return plain
+
+
+def bench_entities(count=5000):
+	import main  #needs the libtcod library, but only opens a window when run as the game
+
+	monsters = []
+	for i in range(count):
+		fighter = main.Fighter(my_path=0, lastx=0, lasty=0, hp=20, defense=1, power=3, xp=20, flicker=0, death_function=None)
+		monsters.append(main.Object(i, i, 'm', 'Mutant', None, 'thingthing', blocks=True, fighter=fighter, ai=main.BasicMonster()))
+
+	slotted = sum(_footprint(m) + _footprint(m.fighter) + _footprint(m.ai) for m in monsters) / float(count)
+	plain = [(_unslotted(m), _unslotted(m.fighter), _unslotted(m.ai)) for m in monsters]
+	unslotted = sum(_footprint(o) + _footprint(f) + _footprint(a) for (o, f, a) in plain) / float(count)
+	print('monster entity (object + fighter + ai): %.0f bytes slotted, %.0f bytes with __dict__' % (slotted, unslotted))
+
+	def walk(entities):
+		total = 0
+		for m in entities:
+			total += m.x + m.y + m.fighter.hp
+		return total
+	for (o, f, a) in plain:
+		o.fighter = f
+	fast = min(timeit.repeat(lambda: walk(monsters), number=20, repeat=3))
+	slow = min(timeit.repeat(lambda: walk([o for (o, f, a) in plain]), number=20, repeat=3))
+	print('reading x, y and fighter.hp of %d monsters x20: %.1f ms slotted, %.1f ms with __dict__' % (count, fast * 1000, slow * 1000))
+
+
+def bench_world(count=5000, fighters=500):
+	import entities
+	import main
+
+	#a level crowded with items, and a few hundred monsters among them
+	world = entities.World()
+	for i in range(count):
+		fighter = None
+		if i % (count // fighters) == 0:
+			fighter = main.Fighter(my_path=0, lastx=0, lasty=0, hp=20, defense=1, power=3, xp=20, flicker=0, death_function=None)
+		world.append(main.Object(i % 97, i % 89, '!', 'thing', None, fighter=fighter))
+
+	def scan_objects():
+		#the old way: every object, checking for a fighter
+		best = None
+		for obj in world:
+			if obj.fighter:
+				dist = (obj.x - 40) ** 2 + (obj.y - 40) ** 2
+				if best is None or dist < best:
+					best = dist
+		return best
+
+	def scan_arrays():
+		best = None
+		xs = world.x
+		ys = world.y
+		for id in world.fighters.ids:
+			dist = (xs[id] - 40) ** 2 + (ys[id] - 40) ** 2
+			if best is None or dist < best:
+				best = dist
+		return best
+
+	assert scan_objects() == scan_arrays()
+	slow = min(timeit.repeat(scan_objects, number=20, repeat=3))
+	fast = min(timeit.repeat(scan_arrays, number=20, repeat=3))
+	print('closest of %d fighters among %d objects x20: %.1f ms scanning objects, %.1f ms on the fighter ids' %
+		  (fighters, count, slow * 1000, fast * 1000))
+
+
+def bench_turns(count=5000, actors=1000, awake=20, turns=200):
+	import scheduler
+
+	#a big level: lots of objects, some of them monsters, and only a few of those near the player
+	class _Actor:
+		def __init__(self):
+			self.turns = 0
+
+		def take_turn(self):
+			self.turns += 1
+
+	objects = [_Actor() if i % (count // actors) == 0 else None for i in range(count)]
+	schedule = scheduler.Scheduler(lambda id: scheduler.NORMAL_SPEED, lambda id: (id, 0))
+	ids = [i for i in range(count) if objects[i] is not None]
+	for id in ids:
+		schedule.add(id)
+	for id in ids[awake:]:
+		schedule.sleep(id)
+
+	def every_object():
+		#the old way: one take_turn() for everything with an AI, after every player action
+		for i in range(turns):
+			for obj in objects:
+				if obj is not None:
+					obj.take_turn()
+
+	def scheduled():
+		for i in range(turns):
+			for id in schedule.advance(scheduler.TURN_TIME):
+				objects[id].take_turn()
+
+	slow = min(timeit.repeat(every_object, number=1, repeat=3))
+	fast = min(timeit.repeat(scheduled, number=1, repeat=3))
+	print('%d turns, %d actors (%d awake) among %d objects: %.1f ms every object, %.1f ms scheduled' %
+		  (turns, actors, awake, count, slow * 1000, fast * 1000))
+
+
+def bench_activity(width=5120, height=768, awake=20, turns=200):
+	import scheduler
+
+	#one turn of take_monster_turns(): wake up the sleepers in sight, then run the awake ones.
+	#the cost should stay put however many monsters sleep elsewhere on the level.
+	for sleeping in (1000, 10000, 100000):
+		rng = random.Random(1)
+		positions = [(rng.randrange(width), rng.randrange(height)) for i in range(sleeping)]
+		positions += [(width // 2 + i % 5, height // 2 + i // 5) for i in range(awake)]
+		schedule = scheduler.Scheduler(lambda id: scheduler.NORMAL_SPEED, positions.__getitem__)
+		for id in range(len(positions)):
+			schedule.add(id)
+			if id < sleeping:
+				schedule.sleep(id)
+
+		def turn():
+			for i in range(turns):
+				schedule.wake_within(width // 2, height // 2, 8)
+				for id in schedule.advance(scheduler.TURN_TIME):
+					pass
+
+		took = min(timeit.repeat(turn, number=1, repeat=3))
+		print('%d turns with %d monsters asleep across the level: %.1f ms (%.3f ms a turn)' %
+			  (turns, sleeping, took * 1000, took * 1000 / turns))
+
+
+def bench_console_buffer(width=59, height=35, repeat=200):
+	from array import array
+	from ctypes import c_int
+	import consolebuffer  #needs the libtcod library
+
+	#what a full screen blit() hands libtcod: seven int arrays the size of the console.
+	#libtcodpy's ConsoleBuffer builds them from its lists every time, the array one passes pointers
+	n = width * height
+	lists = [[i % 256] * n for i in range(7)]
+	arrays = [array('i', values) for values in lists]
+
+	def from_lists():
+		for values in lists:
+			(c_int * n)(*values)
+
+	def pointers():
+		for values in arrays:
+			consolebuffer._pointer(values)
+
+	slow = min(timeit.repeat(from_lists, number=repeat, repeat=3))
+	fast = min(timeit.repeat(pointers, number=repeat, repeat=3))
+	print('%d blits of a %dx%d buffer: %.1f ms building ctypes arrays, %.1f ms passing pointers' %
+		  (repeat, width, height, slow * 1000, fast * 1000))
+
+
+if __name__ == '__main__':
+	bench_carving()
+	bench_entities()
+	bench_world()
+	bench_turns()
+	bench_activity()
+	bench_console_buffer()
@@ -0,0 +1,71 @@
+#map carving on whole masks instead of tile by tile.
+#a Mask is one flat bytearray (row by row, 1 = floor), so rooms and corridors are carved with
+#slice assignments and circular rooms with a stencil computed once per room size.
+import math
+
+_FLOOR = b'\x01'
+
+_disk_stencils = {}
+
+
+def disk_stencil(width, height):
+	#the rows of a circular room in a width x height box, as (dy, dx_from, dx_to) around its center.
+	#same rule as always: the radius is the smaller side over 1.8, clipped to the box.
+	stencil = _disk_stencils.get((width, height))
+	if stencil is None:
+		r = min(width, height) / 1.8
+		(left, top) = (-(width // 2), -(height // 2))
+		(right, bottom) = (left + width, top + height)
+		stencil = []
+		for dy in range(top, bottom + 1):
+			span = [dx for dx in range(left, right + 1) if math.sqrt(dx ** 2 + dy ** 2) <= r]
+			if span:
+				stencil.append((dy, span[0], span[-1]))
+		_disk_stencils[(width, height)] = stencil
+	return stencil
+
+
+class Mask:
+	def __init__(self, width, height):
+		self.width = width
+		self.height = height
+		self.cells = bytearray(width * height)  #all wall to begin with
+
+	def is_floor(self, x, y):
+		return self.cells[y * self.width + x] == 1
+
+	def fill_rows(self, x1, x2, y1, y2):
+		#make every cell with x1 <= x <= x2 and y1 <= y <= y2 passable
+		if x2 < x1:
+			return
+		row = _FLOOR * (x2 - x1 + 1)
+		w = self.width
+		for y in range(y1, y2 + 1):
+			self.cells[y * w + x1:y * w + x2 + 1] = row
+
+	def room(self, room):
+		#the inside of a Rect
+		self.fill_rows(room.x1 + 1, room.x2 - 1, room.y1 + 1, room.y2 - 1)
+
+	def circular_room(self, room):
+		(cx, cy) = ((room.x1 + room.x2) // 2, (room.y1 + room.y2) // 2)
+		w = self.width
+		for (dy, dx_from, dx_to) in disk_stencil(room.x2 - room.x1, room.y2 - room.y1):
+			start = (cy + dy) * w + cx
+			self.cells[start + dx_from:start + dx_to + 1] = _FLOOR * (dx_to - dx_from + 1)
+
+	def h_tunnel(self, x1, x2, y):
+		self.fill_rows(min(x1, x2), max(x1, x2), y, y)
+
+	def v_tunnel(self, y1, y2, x):
+		#a column is every width-th cell, so this is one strided slice
+		(y1, y2) = (min(y1, y2), max(y1, y2))
+		w = self.width
+		self.cells[y1 * w + x:y2 * w + x + 1:w] = _FLOOR * (y2 - y1 + 1)
+
+	def to_tiles(self, make_tile):
+		#build the [x][y] tile grid in one pass; make_tile(floor) returns a new tile
+		w = self.width
+		cells = self.cells
+		return [[make_tile(cells[y * w + x] == 1) for y in range(self.height)]
+				for x in range(w)]
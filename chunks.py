@@ -0,0 +1,152 @@
+#chunked storage for maps far bigger than the screen.
+#tiles live in fixed-size square chunks that are generated (or restored) when the
+#camera gets close and parked again, compressed, once it has moved far enough away.
+import random
+import zlib
+try:
+	import cPickle as pickle
+except ImportError:
+	import pickle
+
+CHUNK_SIZE = 32
+
+
+class Chunk:
+	#one square block of tiles, indexed tiles[x][y] in chunk-local coordinates
+	def __init__(self, cx, cy, tiles, rooms):
+		self.cx = cx
+		self.cy = cy
+		self.tiles = tiles
+		self.rooms = rooms  #rooms carved by the generator, in map coordinates
+		self.objects = []  #objects parked here while the chunk was evicted
+		self.fresh = True  #not populated with monsters and items yet
+
+
+class _Column:
+	#lets a chunked map be indexed like the plain map: map[x][y]
+	def __init__(self, chunked, x):
+		self.chunked = chunked
+		self.x = x
+
+	def __len__(self):
+		return self.chunked.height
+
+	def __getitem__(self, y):
+		return self.chunked.tile(self.x, y)
+
+
+class ChunkedMap:
+	def __init__(self, chunks_wide, chunks_high, generator, seed=0, chunk_size=CHUNK_SIZE):
+		#generator(chunked_map, cx, cy, rng) must return (tiles, rooms) for one chunk
+		self.chunks_wide = chunks_wide
+		self.chunks_high = chunks_high
+		self.chunk_size = chunk_size
+		self.width = chunks_wide * chunk_size
+		self.height = chunks_high * chunk_size
+		self.generator = generator
+		self.seed = seed
+
+		self.chunks = {}  #loaded chunks, by (cx, cy)
+		self.stored = {}  #compressed chunks that were evicted, by (cx, cy)
+		self.loaded = []  #chunks loaded since the last take_loaded()
+		self.active = (0, 0, 0, 0)  #map area (x, y, w, h) covered by the last load_area()
+
+		self.generated = 0
+		self.restored = 0
+		self.evicted = 0
+
+	def __len__(self):
+		return self.width
+
+	def __getitem__(self, x):
+		if x < 0 or x >= self.width:
+			raise IndexError('map x out of range')
+		return _Column(self, x)
+
+	def tile(self, x, y):
+		if y < 0 or y >= self.height:
+			raise IndexError('map y out of range')
+		size = self.chunk_size
+		chunk = self.chunks.get((x // size, y // size))
+		if chunk is None:
+			chunk = self.chunk(x // size, y // size)
+		return chunk.tiles[x % size][y % size]
+
+	def chunk(self, cx, cy):
+		#return a chunk, restoring or generating it if it isn't loaded
+		key = (cx, cy)
+		chunk = self.chunks.get(key)
+		if chunk is not None:
+			return chunk
+
+		data = self.stored.pop(key, None)
+		if data is not None:
+			(tiles, rooms, objects, fresh) = pickle.loads(zlib.decompress(data))
+			chunk = Chunk(cx, cy, tiles, rooms)
+			chunk.objects = objects
+			chunk.fresh = fresh
+			self.restored += 1
+		else:
+			#seeded per chunk, so a chunk comes out the same no matter when it is first visited
+			rng = random.Random((self.seed * 1000003 + cx) * 1000003 + cy)
+			(tiles, rooms) = self.generator(self, cx, cy, rng)
+			chunk = Chunk(cx, cy, tiles, rooms)
+			self.generated += 1
+
+		self.chunks[key] = chunk
+		self.loaded.append(chunk)
+		return chunk
+
+	def peek(self, cx, cy):
+		#the tiles of a chunk without loading it: a loaded chunk's own, or a copy of a parked
+		#chunk's. None if the chunk was never generated
+		chunk = self.chunks.get((cx, cy))
+		if chunk is not None:
+			return chunk.tiles
+		data = self.stored.get((cx, cy))
+		if data is None:
+			return None
+		return pickle.loads(zlib.decompress(data))[0]
+
+	def chunk_rect(self, key):
+		#map area (x, y, w, h) covered by a chunk
+		(cx, cy) = key
+		return (cx * self.chunk_size, cy * self.chunk_size, self.chunk_size, self.chunk_size)
+
+	def load_area(self, x0, y0, x1, y1):
+		#make sure every chunk overlapping the given map rectangle is loaded
+		size = self.chunk_size
+		cx0 = max(0, x0 // size)
+		cy0 = max(0, y0 // size)
+		cx1 = min(self.chunks_wide - 1, x1 // size)
+		cy1 = min(self.chunks_high - 1, y1 // size)
+		for cy in range(cy0, cy1 + 1):
+			for cx in range(cx0, cx1 + 1):
+				self.chunk(cx, cy)
+		self.active = (cx0 * size, cy0 * size, (cx1 - cx0 + 1) * size, (cy1 - cy0 + 1) * size)
+
+	def take_loaded(self):
+		#chunks that came in since the last call, so the game can populate or restore them
+		loaded = self.loaded
+		self.loaded = []
+		return loaded
+
+	def far_chunks(self, distance):
+		#keys of loaded chunks more than 'distance' chunks outside the active area
+		(x, y, w, h) = self.active
+		size = self.chunk_size
+		cx0 = x // size - distance
+		cy0 = y // size - distance
+		cx1 = (x + w) // size - 1 + distance
+		cy1 = (y + h) // size - 1 + distance
+		return [(cx, cy) for (cx, cy) in self.chunks
+				if cx < cx0 or cx > cx1 or cy < cy0 or cy > cy1]
+
+	def evict(self, key, objects=()):
+		#compress a chunk (and the objects standing on it) out of memory
+		chunk = self.chunks.pop(key)
+		if chunk in self.loaded:
+			self.loaded.remove(chunk)
+		data = (chunk.tiles, chunk.rooms, list(chunk.objects) + list(objects), chunk.fresh)
+		self.stored[key] = zlib.compress(pickle.dumps(data, 2))
+		self.evicted += 1
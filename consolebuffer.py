@@ -0,0 +1,151 @@
+#libtcodpy's ConsoleBuffer, kept in contiguous array('i') buffers instead of Python lists.
+#blit() hands libtcod's fill functions pointers straight into the arrays, where the original
+#builds a fresh ctypes array out of every list (seven of them, each the size of the console)
+#on every blit. rectangles are filled and copied a row slice at a time, not cell by cell.
+#a DrawList collects the glyphs of a frame and writes them into a buffer all at once.
+from array import array
+from ctypes import POINTER, c_int, cast, sizeof
+
+import libtcodpy as libtcod
+
+assert array('i').itemsize == sizeof(c_int)
+
+CHANNELS = ('back_r', 'back_g', 'back_b', 'fore_r', 'fore_g', 'fore_b', 'char')
+
+
+def _pointer(values):
+	#the array's own memory as the int * libtcod takes, no copy. only good while the array
+	#lives and isn't resized
+	return cast(values.buffer_info()[0], POINTER(c_int))
+
+
+class ConsoleBuffer:
+	#same interface as libtcodpy's, plus fill_rect() and set_region()
+	def __init__(self, width, height, back_r=0, back_g=0, back_b=0, fore_r=0, fore_g=0, fore_b=0, char=' '):
+		self.width = width
+		self.height = height
+		self.clear(back_r, back_g, back_b, fore_r, fore_g, fore_b, char)
+
+	def clear(self, back_r=0, back_g=0, back_b=0, fore_r=0, fore_g=0, fore_b=0, char=' '):
+		n = self.width * self.height
+		values = (back_r, back_g, back_b, fore_r, fore_g, fore_b, ord(char))
+		for (name, value) in zip(CHANNELS, values):
+			setattr(self, name, array('i', [value]) * n)
+
+	def copy(self):
+		other = ConsoleBuffer(0, 0)
+		other.width = self.width
+		other.height = self.height
+		for name in CHANNELS:
+			setattr(other, name, array('i', getattr(self, name)))
+		return other
+
+	def set_fore(self, x, y, r, g, b, char):
+		#set the character and foreground color of one cell
+		i = self.width * y + x
+		self.fore_r[i] = r
+		self.fore_g[i] = g
+		self.fore_b[i] = b
+		self.char[i] = ord(char)
+
+	def set_back(self, x, y, r, g, b):
+		#set the background color of one cell
+		i = self.width * y + x
+		self.back_r[i] = r
+		self.back_g[i] = g
+		self.back_b[i] = b
+
+	def set(self, x, y, back_r, back_g, back_b, fore_r, fore_g, fore_b, char):
+		#set the background color, foreground color and character of one cell
+		i = self.width * y + x
+		self.back_r[i] = back_r
+		self.back_g[i] = back_g
+		self.back_b[i] = back_b
+		self.fore_r[i] = fore_r
+		self.fore_g[i] = fore_g
+		self.fore_b[i] = fore_b
+		self.char[i] = ord(char)
+
+	def fill_rect(self, x, y, w, h, back=None, fore=None, char=None):
+		#set a w x h rectangle to a background and/or foreground color (libtcod Colors) and/or a
+		#character (a string of one, or a character code), clipped to the buffer
+		(x1, y1) = (max(x, 0), max(y, 0))
+		(x2, y2) = (min(x + w, self.width), min(y + h, self.height))
+		if x2 <= x1 or y2 <= y1:
+			return
+		fills = []
+		if back is not None:
+			fills += [(self.back_r, back.r), (self.back_g, back.g), (self.back_b, back.b)]
+		if fore is not None:
+			fills += [(self.fore_r, fore.r), (self.fore_g, fore.g), (self.fore_b, fore.b)]
+		if char is not None:
+			fills.append((self.char, ord(char) if isinstance(char, str) else char))
+		span = x2 - x1
+		for (channel, value) in fills:
+			row = array('i', [value]) * span
+			for start in range(y1 * self.width + x1, y2 * self.width, self.width):
+				channel[start:start + span] = row
+
+	def set_region(self, x, y, source, sx=0, sy=0, w=None, h=None):
+		#copy a rectangle of another buffer (all of it by default) to (x, y), clipped to both
+		if w is None:
+			w = source.width - sx
+		if h is None:
+			h = source.height - sy
+		if x < 0:
+			(sx, w, x) = (sx - x, w + x, 0)
+		if y < 0:
+			(sy, h, y) = (sy - y, h + y, 0)
+		w = min(w, self.width - x, source.width - sx)
+		h = min(h, self.height - y, source.height - sy)
+		if w <= 0 or h <= 0:
+			return
+		for name in CHANNELS:
+			(to, of) = (getattr(self, name), getattr(source, name))
+			for row in range(h):
+				start = (y + row) * self.width + x
+				from_start = (sy + row) * source.width + sx
+				to[start:start + w] = of[from_start:from_start + w]
+
+	def blit(self, dest, fill_fore=True, fill_back=True):
+		#write the buffer to a console of the same size, through libtcod's fill functions
+		if (libtcod.console_get_width(dest) != self.width or
+			libtcod.console_get_height(dest) != self.height):
+			raise ValueError('ConsoleBuffer.blit: Destination console has an incorrect size.')
+
+		if fill_back:
+			libtcod._lib.TCOD_console_fill_background(dest, _pointer(self.back_r), _pointer(self.back_g), _pointer(self.back_b))
+
+		if fill_fore:
+			libtcod._lib.TCOD_console_fill_foreground(dest, _pointer(self.fore_r), _pointer(self.fore_g), _pointer(self.fore_b))
+			libtcod._lib.TCOD_console_fill_char(dest, _pointer(self.char))
+
+
+class DrawList:
+	#glyphs collected during a frame, to be written into a ConsoleBuffer in one go by flush()
+	#(and from there to the console by its blit), instead of two libtcod calls per glyph
+	def __init__(self):
+		self.cells = []  #(x, y, character code, color), in drawing order
+
+	def __len__(self):
+		return len(self.cells)
+
+	def put(self, x, y, char, color):
+		#char is a string of one or a character code, color a libtcod Color
+		if isinstance(char, str):
+			char = ord(char)
+		self.cells.append((x, y, char, color))
+
+	def flush(self, buffer):
+		#draw the glyphs over the buffer's foreground, later ones on top, and start a new list.
+		#glyphs off the buffer are left out
+		(w, h) = (buffer.width, buffer.height)
+		(fore_r, fore_g, fore_b, chars) = (buffer.fore_r, buffer.fore_g, buffer.fore_b, buffer.char)
+		for (x, y, char, color) in self.cells:
+			if 0 <= x < w and 0 <= y < h:
+				i = y * w + x
+				fore_r[i] = color.r
+				fore_g[i] = color.g
+				fore_b[i] = color.b
+				chars[i] = char
+		self.cells = []
@@ -0,0 +1,227 @@
+#entity storage. a World holds the objects of one level in drawing order, and keeps a copy of
+#their hot data (position, fighter and AI components) in component arrays indexed by entity id,
+#so systems can walk just the entities that have a fighter or an AI, straight off the arrays.
+#the objects keep their own attributes too, and single reads go to those.
+from array import array
+
+import scheduler
+
+
+class Slotted(object):
+	#base for objects and their components: no per-instance __dict__, so thousands of them stay
+	#small, while save_game() (and chunk parking) can still pickle them
+	__slots__ = ()
+
+	def __getstate__(self):
+		state = {}
+		for cls in type(self).__mro__:
+			for name in getattr(cls, '__slots__', ()):
+				if hasattr(self, name):
+					state[name] = getattr(self, name)
+		return state
+
+	def __setstate__(self, state):
+		for (name, value) in state.items():
+			setattr(self, name, value)
+
+
+MIRRORED = frozenset(('x', 'y', 'fighter', 'ai'))
+
+
+class Entity(Slotted):
+	#position, looks and components are plain slots, so reading them is as fast as any other
+	#attribute. while the entity is in a world, writing x, y, fighter or ai also updates the
+	#world's arrays and id sets, which only the systems walking many entities at once read
+	__slots__ = ('world', 'id', 'x', 'y', 'char', 'color', 'fighter', 'ai')
+
+	def __init__(self):
+		self.world = None
+		self.id = None
+
+	def __setattr__(self, name, value):
+		object.__setattr__(self, name, value)
+		if name in MIRRORED and self.world is not None:
+			self.world.mirror(self.id, name, value)
+
+	def __getstate__(self):
+		#pickled on its own, without the world it was in
+		state = Slotted.__getstate__(self)
+		state.pop('world', None)
+		state.pop('id', None)
+		return state
+
+	def __setstate__(self, state):
+		self.world = None
+		self.id = None
+		Slotted.__setstate__(self, state)
+
+
+class IdSet:
+	#ids with some component, in a dense list that systems can walk
+	def __init__(self):
+		self.ids = []
+		self.slots = {}
+
+	def __len__(self):
+		return len(self.ids)
+
+	def add(self, id):
+		if id not in self.slots:
+			self.slots[id] = len(self.ids)
+			self.ids.append(id)
+
+	def discard(self, id):
+		slot = self.slots.pop(id, None)
+		if slot is None:
+			return
+		last = self.ids.pop()
+		if slot < len(self.ids):
+			self.ids[slot] = last
+			self.slots[last] = slot
+
+
+class World(object):
+	#the objects of a level. behaves like the list it replaces (iteration in drawing order,
+	#indexing, append/insert/remove) while keeping the component arrays in step.
+	def __init__(self, objects=()):
+		self.order = []  #objects in drawing order
+		self.entities = []  #object by entity id (None for a free id)
+		self.free_ids = []
+
+		#component arrays, indexed by entity id
+		self.x = array('i')
+		self.y = array('i')
+		self.fighter = []
+		self.ai = []
+
+		self.fighters = IdSet()
+		self.actors = IdSet()
+		self.schedule = scheduler.Scheduler(self.speed_of, self.position_of)  #turn order of the actors (see scheduler.py)
+
+		for obj in objects:
+			self.append(obj)
+
+	def __reduce__(self):
+		#the arrays are rebuilt from the objects themselves
+		return (World, (list(self.order),))
+
+	def __iter__(self):
+		return iter(self.order)
+
+	def __len__(self):
+		return len(self.order)
+
+	def __getitem__(self, index):
+		return self.order[index]
+
+	def __contains__(self, obj):
+		return obj.world is self
+
+	def index(self, obj):
+		return self.order.index(obj)
+
+	def append(self, obj):
+		self._join(obj)
+		self.order.append(obj)
+
+	def insert(self, index, obj):
+		self._join(obj)
+		self.order.insert(index, obj)
+
+	def insert_many(self, index, objs):
+		for obj in objs:
+			self._join(obj)
+		self.order[index:index] = objs
+
+	def remove(self, obj):
+		self.order.remove(obj)
+		self._leave(obj)
+
+	def remove_many(self, objs):
+		for obj in objs:
+			self._leave(obj)
+		self.order = [obj for obj in self.order if obj.world is self]
+
+	def send_to_back(self, obj):
+		#reordering keeps the entity id
+		self.order.remove(obj)
+		self.order.insert(0, obj)
+
+	def mirror(self, id, name, value):
+		#an entity's x, y, fighter or ai was set
+		if name == 'x':
+			self.x[id] = value
+		elif name == 'y':
+			self.y[id] = value
+		elif name == 'fighter':
+			self.set_fighter(id, value)
+		else:
+			self.set_ai(id, value)
+
+	def set_fighter(self, id, fighter):
+		self.fighter[id] = fighter
+		if fighter is None:
+			self.fighters.discard(id)
+		else:
+			self.fighters.add(id)
+
+	def set_ai(self, id, ai):
+		#swapping one AI for another (confusion) keeps the actor's place in the turn order
+		self.ai[id] = ai
+		if ai is None:
+			self.actors.discard(id)
+			self.schedule.remove(id)
+		else:
+			self.actors.add(id)
+			if id not in self.schedule:
+				self.schedule.add(id)
+
+	def speed_of(self, id):
+		return getattr(self.fighter[id], 'speed', scheduler.NORMAL_SPEED)
+
+	def position_of(self, id):
+		return (self.x[id], self.y[id])
+
+	def with_fighter(self):
+		#snapshot of the objects with a fighter component
+		entities = self.entities
+		return [entities[id] for id in self.fighters.ids]
+
+	def with_ai(self):
+		#snapshot of the objects with an AI, safe to walk while they act (and die)
+		entities = self.entities
+		return [entities[id] for id in self.actors.ids]
+
+	def _join(self, obj):
+		if obj.world is not None:
+			obj.world._leave(obj)
+
+		if self.free_ids:
+			id = self.free_ids.pop()
+			self.entities[id] = obj
+			self.x[id] = obj.x
+			self.y[id] = obj.y
+		else:
+			id = len(self.entities)
+			self.entities.append(obj)
+			self.x.append(obj.x)
+			self.y.append(obj.y)
+			self.fighter.append(None)
+			self.ai.append(None)
+		obj.world = self
+		obj.id = id
+		self.set_fighter(id, obj.fighter)
+		self.set_ai(id, obj.ai)
+
+	def _leave(self, obj):
+		#free its id; the object keeps its own values
+		id = obj.id
+		self.fighters.discard(id)
+		self.actors.discard(id)
+		self.schedule.remove(id)
+		self.entities[id] = None
+		self.fighter[id] = None
+		self.ai[id] = None
+		self.free_ids.append(id)
+		obj.world = None
+		obj.id = None
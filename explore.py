@@ -0,0 +1,40 @@
+#auto-explore: the way to the nearest frontier, an unexplored cell next to explored floor.
+#one breadth-first pass from the player (a Dijkstra pass where every step costs the same) over
+#explored floor finds the closest such cell and the path to it together; the walk then follows
+#that path, and the search only runs again once the cell it was heading for has been seen.
+#only explored tiles are ever looked at, so the search knows no more of the map than the player.
+from collections import deque
+
+NEIGHBOURS = ((0, -1), (0, 1), (-1, 0), (1, 0), (-1, -1), (1, -1), (-1, 1), (1, 1))
+
+
+def path_to_frontier(x, y, left, top, right, bottom, is_floor, is_explored):
+	#(target, steps) for the nearest frontier cell within the bounds: the steps (dx, dy) from
+	#(x, y) are in reverse order, so pop() gives the next one. None if there is none left.
+	#is_floor is only asked about explored cells
+	came_from = {(x, y): None}
+	queue = deque([(x, y)])
+	while queue:
+		(cx, cy) = queue.popleft()
+		for (dx, dy) in NEIGHBOURS:
+			(nx, ny) = (cx + dx, cy + dy)
+			if nx < left or ny < top or nx > right or ny > bottom or (nx, ny) in came_from:
+				continue
+			if not is_explored(nx, ny):
+				came_from[(nx, ny)] = (cx, cy)
+				return ((nx, ny), _steps(came_from, (nx, ny)))
+			if not is_floor(nx, ny):
+				continue
+			came_from[(nx, ny)] = (cx, cy)
+			queue.append((nx, ny))
+	return None
+
+
+def _steps(came_from, cell):
+	#walk back from the cell to the start
+	steps = []
+	previous = came_from[cell]
+	while previous is not None:
+		steps.append((cell[0] - previous[0], cell[1] - previous[1]))
+		(cell, previous) = (previous, came_from[previous])
+	return steps
@@ -0,0 +1,132 @@
+#index of the free floor cells of a level, and of which cells are connected to which.
+#kept in sync as blocking objects come and go, so finding a free (or reachable) cell is a
+#single random pick instead of a round of random guesses.
+import random
+
+
+class _Bag:
+	#unordered set with O(1) add, discard and random pick
+	def __init__(self):
+		self.items = []
+		self.slots = {}
+
+	def __len__(self):
+		return len(self.items)
+
+	def __contains__(self, item):
+		return item in self.slots
+
+	def add(self, item):
+		if item not in self.slots:
+			self.slots[item] = len(self.items)
+			self.items.append(item)
+
+	def discard(self, item):
+		slot = self.slots.pop(item, None)
+		if slot is None:
+			return
+		#fill the hole with the last item, so nothing has to shift
+		last = self.items.pop()
+		if slot < len(self.items):
+			self.items[slot] = last
+			self.slots[last] = slot
+
+	def pick(self, rng=random):
+		if not self.items:
+			return None
+		return self.items[rng.randrange(len(self.items))]
+
+
+class FreeTileIndex:
+	def __init__(self):
+		self.floor = set()  #cells whose tile isn't blocked
+		self.free = _Bag()  #floor cells with no blocking object on them
+		self.blockers = {}  #number of blocking objects on each cell
+		self.region = None  #connected region of every floor cell, rebuilt when needed
+		self.region_free = None  #free cells of each region
+
+	def __len__(self):
+		return len(self.free)
+
+	def add_area(self, grid, x0, y0, width, height):
+		#index the floor cells of a rectangle of the map
+		for x in range(x0, x0 + width):
+			column = grid[x]
+			for y in range(y0, y0 + height):
+				if not column[y].blocked:
+					cell = (x, y)
+					self.floor.add(cell)
+					if not self.blockers.get(cell):
+						self.free.add(cell)
+		self.region = None
+
+	def occupied(self, x, y):
+		#is there a blocking object on this cell?
+		return (x, y) in self.blockers
+
+	def block(self, x, y):
+		#a blocking object arrived on this cell
+		cell = (x, y)
+		self.blockers[cell] = self.blockers.get(cell, 0) + 1
+		self.free.discard(cell)
+		if self.region is not None and cell in self.region:
+			self.region_free[self.region[cell]].discard(cell)
+
+	def unblock(self, x, y):
+		#a blocking object left this cell (moved, died or was removed)
+		cell = (x, y)
+		count = self.blockers.get(cell, 0) - 1
+		if count > 0:
+			self.blockers[cell] = count
+			return
+		self.blockers.pop(cell, None)
+		if cell in self.floor:
+			self.free.add(cell)
+			if self.region is not None:
+				self.region_free[self.region[cell]].add(cell)
+
+	def move(self, old_x, old_y, new_x, new_y):
+		self.unblock(old_x, old_y)
+		self.block(new_x, new_y)
+
+	def random_free(self, rng=random):
+		#any free floor cell, or None if there is none at all
+		return self.free.pick(rng)
+
+	def region_of(self, x, y):
+		self._find_regions()
+		return self.region.get((x, y))
+
+	def random_reachable(self, x, y, rng=random):
+		#a free floor cell connected to (x, y), or None if there is none
+		self._find_regions()
+		region = self.region.get((x, y))
+		if region is None:
+			return None
+		return self.region_free[region].pick(rng)
+
+	def _find_regions(self):
+		#flood fill the floor, moving the same way monsters do (diagonals included)
+		if self.region is not None:
+			return
+		self.region = region = {}
+		self.region_free = []
+		for start in self.floor:
+			if start in region:
+				continue
+			number = len(self.region_free)
+			free = _Bag()
+			self.region_free.append(free)
+			region[start] = number
+			stack = [start]
+			while stack:
+				cell = stack.pop()
+				if cell in self.free:
+					free.add(cell)
+				(x, y) = cell
+				for dx in (-1, 0, 1):
+					for dy in (-1, 0, 1):
+						other = (x + dx, y + dy)
+						if other in self.floor and other not in region:
+							region[other] = number
+							stack.append(other)
@@ -0,0 +1,68 @@
+#key bindings: which key does what, compiled into two dicts (special keys by their libtcod key
+#code, everything else by its character) so a key press is looked up instead of compared against
+#every binding in turn. the defaults can be changed from a config file, one action per line:
+#
+#	north = UP KP8 k
+#
+#where a single character is that character and anything longer is a libtcod key code without
+#its KEY_ prefix. binding keys to an action takes them off whatever they did before.
+import libtcodpy as libtcod
+
+
+class KeyBindings:
+	def __init__(self, bindings):
+		self.by_vk = {}  #key code -> action
+		self.by_char = {}  #character -> action
+		self.keys = {}  #action -> key names, as last bound
+		for (action, names) in bindings:
+			self.bind(action, names)
+
+	def bind(self, action, names):
+		#bind an action to a list of key names, in place of the keys it had
+		codes = [self._lookup(name) for name in names]  #a bad name raises before anything changes
+		for name in self.keys.get(action, ()):
+			(table, code) = self._lookup(name)
+			if table.get(code) == action:
+				del table[code]
+		for (name, (table, code)) in zip(names, codes):
+			old = table.get(code)
+			if old is not None and old != action:
+				self.keys[old] = [other for other in self.keys[old] if other != name]
+			table[code] = action
+		self.keys[action] = list(names)
+
+	def _lookup(self, name):
+		#(the table a key name goes in, its code there)
+		if len(name) == 1:
+			return (self.by_char, name)
+		code = getattr(libtcod, 'KEY_' + name, None)
+		if not isinstance(code, int):
+			raise ValueError('unknown key ' + name)
+		return (self.by_vk, code)
+
+	def action(self, key):
+		#the action bound to a libtcod key press, or None
+		action = self.by_vk.get(key.vk)
+		if action is None and 0 < key.c < 256:
+			action = self.by_char.get(chr(key.c))
+		return action
+
+	def load(self, path):
+		#rebind the actions listed in a config file. mistakes are reported and skipped
+		try:
+			lines = open(path).readlines()
+		except IOError:
+			return False
+		for (number, line) in enumerate(lines):
+			line = line.split('#', 1)[0].strip()
+			if not line:
+				continue
+			(action, equals, names) = line.partition('=')
+			action = action.strip()
+			try:
+				if not equals or action not in self.keys:
+					raise ValueError('expected an action = keys')
+				self.bind(action, names.split())
+			except ValueError as e:
+				print('Key bindings error in %s, line %d: %s' % (path, number + 1, e))
+		return True
@@ -0,0 +1,113 @@
+#the light on the map. a light source casts its color over the cells it can see, fading with
+#the distance, and the light of a cell is the sum of all that reaches it. lights that never move
+#(terminals, glowing sludge) are cast once per FOV window: what each one adds is kept, and summed
+#into the static light map, one array('i') per channel. the player's torch moves, so it is cast
+#again whenever the FOV is, but only over the cells in view, which the FOV has worked out already.
+#the two are added up (to at most 255) for the cells either changes, so however many lights there
+#are, reading the light of a cell is one lookup per channel.
+from array import array
+
+import libtcodpy as libtcod
+import visibility
+
+
+class Light:
+	def __init__(self, x, y, radius, color, least=0.0):
+		self.x = x
+		self.y = y
+		self.radius = radius
+		self.color = color  #(r, g, b) at full strength, right at the source
+		self.least = least  #the strength it keeps, however far it gets
+
+
+def falloff(light, x, y):
+	#how much of the light reaches (x, y), from 1 at the source down to a little (or light.least)
+	#at the radius, and none past it
+	d2 = (x - light.x) ** 2 + (y - light.y) ** 2
+	f = 1.0 - d2 / float((light.radius + 1) ** 2)
+	if f <= 0:
+		return 0.0
+	return max(f, light.least)
+
+
+class LightMap:
+	def __init__(self, x0, y0, width, height):
+		#the window of the map it covers, in map coordinates (the same as the FOV map's)
+		self.x0 = x0
+		self.y0 = y0
+		self.width = width
+		self.height = height
+		n = width * height
+		self.static = [array('i', [0]) * n for channel in range(3)]  #r, g and b of the static lights
+		self.dynamic = [array('i', [0]) * n for channel in range(3)]  #and of the torch
+		self.total = [array('i', [0]) * n for channel in range(3)]  #both, at most 255: what gets painted
+		self.lit = []  #the cells the torch reached last time
+		self.contributions = {}  #static Light -> [(cell, r, g, b)] it adds
+
+	def __len__(self):
+		return len(self.contributions)
+
+	def add_static(self, fov_map, light, algo):
+		#cast a light that doesn't move, on the FOV map's walls. this recomputes the FOV map's
+		#field of view, so the player's must be worked out again afterwards
+		(x, y) = (light.x - self.x0, light.y - self.y0)
+		if not (0 <= x < self.width and 0 <= y < self.height):
+			return
+		libtcod.map_compute_fov(fov_map, x, y, light.radius, True, algo)
+		(left, top) = (max(0, x - light.radius), max(0, y - light.radius))
+		(right, bottom) = (min(self.width - 1, x + light.radius), min(self.height - 1, y + light.radius))
+		cells = []
+		for wy in range(top, bottom + 1):
+			for wx in range(left, right + 1):
+				if libtcod.map_is_in_fov(fov_map, wx, wy):
+					cells.append(wy * self.width + wx)
+		contribution = self._cast(light, cells)
+		self.contributions[light] = contribution
+		self._sum(self.static, contribution, 1)
+		self._add_up([i for (i, lr, lg, lb) in contribution])
+
+	def remove_static(self, light):
+		contribution = self.contributions.pop(light, None)
+		if contribution is not None:
+			self._sum(self.static, contribution, -1)
+			self._add_up([i for (i, lr, lg, lb) in contribution])
+
+	def cast_torch(self, light, view):
+		#the torch over the cells a Visibility has lit, in place of where it was last time
+		(r, g, b) = self.dynamic
+		dark = self.lit
+		for i in dark:
+			r[i] = g[i] = b[i] = 0
+		self.lit = [i for i in view.lit if view.cells[i] == visibility.LIT]
+		self._sum(self.dynamic, self._cast(light, self.lit), 1)
+		self._add_up(dark)
+		self._add_up(self.lit)
+
+	def level(self, x, y):
+		#(r, g, b) of the light at (x, y), each at most 255
+		i = (y - self.y0) * self.width + (x - self.x0)
+		(r, g, b) = self.total
+		return (r[i], g[i], b[i])
+
+	def _cast(self, light, cells):
+		(cr, cg, cb) = light.color
+		w = self.width
+		contribution = []
+		for i in cells:
+			f = falloff(light, self.x0 + i % w, self.y0 + i // w)
+			if f > 0:
+				contribution.append((i, int(cr * f), int(cg * f), int(cb * f)))
+		return contribution
+
+	def _add_up(self, cells):
+		#the totals of some cells, after their static or torch light changed
+		for (total, static, dynamic) in zip(self.total, self.static, self.dynamic):
+			for i in cells:
+				total[i] = min(255, static[i] + dynamic[i])
+
+	def _sum(self, channels, contribution, sign):
+		(r, g, b) = channels
+		for (i, lr, lg, lb) in contribution:
+			r[i] += sign * lr
+			g[i] += sign * lg
+			b[i] += sign * lb
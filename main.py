@@ -6,11 +6,26 @@
 import libtcodpy as libtcod
 import os
 import math
-import textwrap
 import random
 import shelve
+import time
 import mapcreate
-import maps
+import chunks
+import staticmaps
+import freetiles
+import randomtables
+import carving
+import entities
+import scheduler
+import visibility
+import minimap
+import consolebuffer
+import palette
+import lighting
+import messages
+import overlays
+import keys
+import explore
 
 
 #actual size of the window
@@ -36,10 +51,19 @@ SIDEBAR_WIDTH = 16
 SIDEBAR_Y = 0
 SIDEBAR_X = 43
 
+#the minimap in the sidebar, in console cells (each shows 2x2 minimap pixels)
+MINIMAP_X = SIDEBAR_X + 1
+MINIMAP_Y = 4
+MINIMAP_WIDTH = SIDEBAR_WIDTH - 2
+MINIMAP_HEIGHT = 12
+MINIMAP_LEAST_SCALE = 2  #map cells per minimap pixel at the least, so the sidebar covers more than the camera
 
 MSG_X = 1
 MSG_WIDTH = SCREEN_WIDTH - BAR_WIDTH - 4
 MSG_HEIGHT = PANEL_HEIGHT - 2
+MSG_HISTORY = 500  #messages kept for the history screen
+MENU_WINDOWS = 8  #menu windows kept drawn, to blit again when the same menu reopens
+SPARE_CONSOLES = 2  #off-screen consoles of each size kept for the next overlay that size
 INVENTORY_WIDTH = 40
 CHARACTER_SCREEN_WIDTH = 40
 LEVEL_SCREEN_WIDTH = 50
@@ -49,7 +73,31 @@ LEVEL_SCREEN_WIDTH = 50
 ROOM_MAX_SIZE = 10
 ROOM_MIN_SIZE = 6
 MAX_ROOMS = 30
- 
+
+#derelict ships are far too big to build in one go: they are streamed in chunks (see chunks.py)
+DERELICT_CHUNKS_WIDE = 160
+DERELICT_CHUNKS_HIGH = 24
+DERELICT_STAIRS_DISTANCE = 3  #how many chunks away from the airlock the way down is
+CHUNK_MAX_ROOMS = 8
+CHUNK_LOAD_MARGIN = 16  #cells past the edge of the camera that must always be loaded
+CHUNK_EVICT_DISTANCE = 1  #chunks kept around the loaded area before they are parked
+ 
+#what turns up in the rooms of a derelict, by dungeon level: a weight, or [[weight, from level], ...]
+SPAWN_TABLES = randomtables.LevelTables({
+	'monsters': {
+		'Mutant': [[80, 2], [40, 5], [10, 9], [0, 12]],  #thug always shows up, even if all other monsters have 0 chance
+		'Abomination': [[10, 3], [15, 5], [10, 7], [0, 12]],
+	},
+	'items': {
+		'heal': 35,  #healing potion always shows up, even if all other items have 0 chance
+		'lightning': [[25, 4]],
+		'fireball': [[25, 6]],
+		'confuse': [[10, 2]],
+		'sword': [[5, 4]],
+		'shield': [[15, 8]],
+	},
+})
+
 #spell values
 HEAL_AMOUNT = 40
 LIGHTNING_DAMAGE = 40
@@ -67,14 +115,65 @@ LEVEL_UP_FACTOR = 150
 FOV_ALGO = 0  #default FOV algorithm
 FOV_LIGHT_WALLS = True  #light walls or not
 TORCH_RADIUS = 8
+SIGHT_RADIUS = 8  #how far line of sight is worked out, for monsters that see further than the torch lights
+TORCH_COLOR = (255, 255, 255)  #the light of the player's torch (see lighting.py)
+TORCH_LEAST = 0.5  #and at least this much of it on every cell in view, so they stand out from remembered ones
+STAIRS_LIGHT_RADIUS = 3  #the way up and down glows in its own color
+SLUDGE_LIGHT_RADIUS = 2
+SLUDGE_LIGHT_COLOR = (90, 130, 0)
+CACHE_HUB_FOV = True  #remember the FOV for every spot of the hub, whose walls never change
+
+MONSTER_MEMORY = 15  #turns a monster keeps looking for the player after losing sight of them
+
+#monsters further than this from the player are left asleep, however big the level is
+ACTIVITY_RADIUS = 24
+COMBAT_NOISE_RADIUS = 12  #how far the sound of a fight carries
+BLAST_NOISE_RADIUS = 20  #lightning and fireballs are louder
+
+DEBUG = False  #show engine statistics in the sidebar
+
+RUN_STEPS_PER_FRAME = 8  #steps (and monster turns) taken between two frames while running or exploring
+
+#what the keys do, unless data/keys.cfg says otherwise (see keys.py)
+KEY_BINDINGS = [
+	('exit', ['ESCAPE']),
+	('north', ['UP', 'KP8']),
+	('south', ['DOWN', 'KP2']),
+	('west', ['LEFT', 'KP4']),
+	('east', ['RIGHT', 'KP6']),
+	('northwest', ['HOME', 'KP7']),
+	('northeast', ['PAGEUP', 'KP9']),
+	('southwest', ['END', 'KP1']),
+	('southeast', ['PAGEDOWN', 'KP3']),
+	('wait', ['KP5']),
+	('run', ['r']),  #then a direction: keep moving that way until something comes up
+	('explore', ['x']),  #walk to the nearest unexplored spot until something comes up
+	('pick up', ['g']),
+	('inventory', ['i']),
+	('drop', ['d']),
+	('skip level', ['j']),
+	('history', ['h']),
+	('overview', ['m']),
+	('character', ['c']),
+	('stairs down', ['<']),
+	('stairs up', ['>']),
+	]
+DIRECTIONS = {'north': (0, -1), 'south': (0, 1), 'west': (-1, 0), 'east': (1, 0),
+			  'northwest': (-1, -1), 'northeast': (1, -1), 'southwest': (-1, 1), 'southeast': (1, 1)}
  
 LIMIT_FPS = 26  #20 frames-per-second maximum
  
  
-color_dark_wall = libtcod.Color(0, 0, 10)
-color_light_wall = libtcod.Color(50, 50, 50)
-color_dark_ground = libtcod.Color(0, 0, 0)
-color_light_ground = libtcod.Color(22, 22, 22)
+#the map colors of each kind of level (see palette.py)
+THEMES = {
+	'hub': palette.Theme(dark_wall=(50, 50, 50), light_wall=(100, 100, 100), dark_ground=(22, 22, 22), light_ground=(42, 42, 42),
+						 sludge=libtcod.darkest_lime, space=libtcod.darkest_blue),
+	'derelict': palette.Theme(dark_wall=(0, 0, 10), light_wall=(50, 50, 50), dark_ground=(0, 0, 0), light_ground=(22, 22, 22),
+							  sludge=libtcod.darkest_lime, space=libtcod.darkest_blue),
+	}
+
+minimap_wall = palette.color(90, 90, 90)
+minimap_ground = palette.color(30, 30, 45)
  
  
 class Tile:
@@ -87,9 +186,6 @@ class Tile:
 		self.door = door
 		self.space = space
 
-		#all tiles start unexplored
-		self.explored = False
-
 		#by default, if a tile is blocked, it also blocks sight
 		if block_sight is None: block_sight = blocked
 		self.block_sight = block_sight
@@ -112,10 +208,14 @@ class Rect:
 		return (self.x1 <= other.x2 and self.x2 >= other.x1 and
 				self.y1 <= other.y2 and self.y2 >= other.y1)
  
-class Object:
+class Object(entities.Entity):
 	#this is a generic object: the player, a monster, an item, the stairs...
-	#it's always represented by a character on screen.
+	#it's always represented by a character on screen. while it's on a level, the level's
+	#entities.World keeps a copy of its position, fighter and AI (see entities.py).
+	__slots__ = ('name', 'desc', 'blocks', 'always_visible', 'blocks_sight', 'item', 'equipment', 'level')
+
 	def __init__(self, x, y, char, name, color, desc=None, blocks=False, always_visible=False, fighter=None, ai=None, item=None, equipment=None):
+		entities.Entity.__init__(self)
 		self.x = x
 		self.y = y
 		self.char = char
@@ -147,6 +247,8 @@ class Object:
 	def move(self, dx, dy):
 		#move by the given amount, if the destination is not blocked
 		if not is_blocked(self.x + dx, self.y + dy):
+			if self.blocks:
+				free_tiles.move(self.x, self.y, self.x + dx, self.y + dy)
 			self.x += dx
 			self.y += dy
 
@@ -162,28 +264,21 @@ class Object:
  
 	def send_to_back(self):
 		#make this object be drawn first, so all others appear above it if they're in the same tile.
-		global objects
-		objects.remove(self)
-		objects.insert(0, self)
+		objects.send_to_back(self)
  
 	def draw(self):
 		#only show if it's visible to the player; or it's set to "always visible" and on an explored tile
-		if libtcod.map_is_in_fov(fov_map, self.x, self.y):
+		if in_fov(self.x, self.y):
 			(x, y) = to_camera_coordinates(self.x, self.y)
 
 			if x is not None:
-				#set the color and then draw the character that represents this object at its position
-				libtcod.console_set_default_foreground(con, self.color)
-				libtcod.console_put_char(con, x, y, self.char, libtcod.BKGND_NONE)
+				#the character that represents this object goes on this frame's draw list
+				glyphs.put(x, y, self.char, self.color)
 
-	def clear(self):
-		(x, y) = to_camera_coordinates(self.x, self.y)
-		if x is not None:
-		#erase the character that represents this object
-			libtcod.console_put_char(con, x, y, ' ', libtcod.BKGND_NONE)
-
-class Furniture:
+class Furniture(entities.Slotted):
 #an item that can be picked up and used.
+	__slots__ = ('use_function', 'opened', 'owner')
+
 	def __init__(self, use_function=None, opened=False):
 		self.use_function = use_function
 		self.opened = opened
@@ -194,12 +289,18 @@ class Furniture:
 			message('The ' + self.owner.name + ' cannot be used.')
 
  
-class Fighter:
+class Fighter(entities.Slotted):
 	#combat-related properties and methods (monster, player, NPC).
-	def __init__(self, my_path, lastx, lasty, hp, defense, power, xp, flicker, death_function=None):
+	__slots__ = ('my_path', 'lastx', 'lasty', 'base_max_hp', 'hp', 'base_defense', 'base_power', 'xp',
+				 'death_function', 'flicker', 'speed', 'sight', 'owner')
+
+	def __init__(self, my_path, lastx, lasty, hp, defense, power, xp, flicker, death_function=None, speed=scheduler.NORMAL_SPEED,
+				 sight=TORCH_RADIUS):
 		self.my_path = my_path
 		self.lastx = lastx
 		self.lasty = lasty
+		self.speed = speed  #how often it gets to act, see scheduler.py
+		self.sight = sight  #how far it can see (no further than SIGHT_RADIUS)
 
 		self.base_max_hp = hp
 		self.hp = hp
@@ -213,6 +314,13 @@ class Fighter:
 			self.death_function = globals()[death_function]
 		else:
 			self.death_function = death_function
+
+	def __getstate__(self):
+		#my_path is a libtcod handle, only good in the process that made it: save it as no path
+		state = entities.Slotted.__getstate__(self)
+		state['my_path'] = 0
+		return state
+
 	@property
 	def power(self):  #return actual power, by summing up the bonuses from all equipped items
 		bonus = sum(equipment.power_bonus for equipment in get_all_equipped(self.owner))
@@ -228,13 +336,19 @@ class Fighter:
 		bonus = sum(equipment.max_hp_bonus for equipment in get_all_equipped(self.owner))
 		return self.base_max_hp + bonus
 
-	def move_towards(self, target_x, target_y):
+	def path_to(self, target_x, target_y):
 		#get yo' a-star on in a fistful of code?!  this lib is awesome!
+		#computes my_path to the target; False if there's no way there
 
 		#if no path exists yet, get right onto that, stat!
 		if self.my_path is 0:
 			self.my_path = libtcod.path_new_using_map(fov_map, 1.0)
 
+		#the FOV map (and so the path) only covers the loaded window of the map
+		(target_x, target_y) = (target_x - fov_x, target_y - fov_y)
+		if target_x < 0 or target_y < 0 or target_x >= fov_width or target_y >= fov_height:
+			return False
+
 		reblock = False
 
 		#need some logic here...constantly refresh path seems omniscient and computationally expensive
@@ -244,21 +358,44 @@ class Fighter:
 
 		libtcod.map_set_properties(fov_map, target_x, target_y, True, True)	#momentarily set the target to unblocked so the pathing works. kludgy, I know, but easier than writing my own a*!!!!
 
-		libtcod.path_compute(self.my_path, self.owner.x, self.owner.y, target_x, target_y)
+		libtcod.path_compute(self.my_path, self.owner.x - fov_x, self.owner.y - fov_y, target_x, target_y)
 
 		if reblock:
 			libtcod.map_set_properties(fov_map, target_x, target_y, True, False) #kludge moment over. resume normal viewing!
 
-		if not libtcod.path_is_empty(self.my_path):
+		return not libtcod.path_is_empty(self.my_path)
+
+	def step_along_path(self):
+		#take the next step of my_path as it is, without computing it again. False if the path
+		#is used up or someone is standing in the way
+		if self.my_path is 0 or libtcod.path_is_empty(self.my_path):
+			return False
+		(x, y) = libtcod.path_get(self.my_path, 0)
+		(x, y) = (x + fov_x, y + fov_y)
+		if is_blocked(x, y):
+			return False
+		libtcod.path_walk(self.my_path, False)
+		set_fov_properties(self.owner.x, self.owner.y, True, True)
+		free_tiles.move(self.owner.x, self.owner.y, x, y)
+		self.owner.x = x
+		self.owner.y = y
+		set_fov_properties(x, y, True, False)
+		return True
+
+	def move_towards(self, target_x, target_y):
+		if self.path_to(target_x, target_y):
 			x, y = libtcod.path_walk(self.my_path,True)
+			if x is not None:
+				(x, y) = (x + fov_x, y + fov_y)
 			if x and not is_blocked(x,y) and libtcod.path_size(self.my_path) < 10: #more than ten is too far, don't worry about it
-				libtcod.map_set_properties(fov_map, self.owner.x, self.owner.y, True, True)
+				set_fov_properties(self.owner.x, self.owner.y, True, True)
+				free_tiles.move(self.owner.x, self.owner.y, x, y)
 				self.owner.x = x
 				self.owner.y = y
-				libtcod.map_set_properties(fov_map, x, y, True, False)
+				set_fov_properties(x, y, True, False)
 			else:
 				self.owner.move(libtcod.random_get_int(0, -1, 1), libtcod.random_get_int(0, -1, 1))
-
+ 
 	def attack(self, target):
 		#a simple formula for attack damage
 		damage = self.power - target.fighter.defense
@@ -284,6 +421,10 @@ class Fighter:
 			self.hp -= damage
 			self.flicker = 1
 
+			#getting hurt wakes anyone up
+			if self.owner.world is not None:
+				self.owner.world.schedule.wake(self.owner.id)
+
 			if self.hp <= 4 and self.hp > 0 :
 				if self.owner == player:
 					message(self.owner.name.capitalize() + ' looks badly wounded!')
@@ -305,23 +446,53 @@ class Fighter:
 		if self.hp > self.max_hp:
 			self.hp = self.max_hp
 
-class BasicMonster:
-	#AI for a basic monster.
+class BasicMonster(entities.Slotted):
+	#AI for a basic monster. it chases the player while it can see them, then goes looking
+	#where it saw them last for a while before it gives up.
+	__slots__ = ('memory', 'owner')
+
+	def __init__(self):
+		self.memory = 0  #turns left to keep looking for the player
+
 	def take_turn(self):
 		monster = self.owner
-		if libtcod.map_is_in_fov(fov_map, monster.x, monster.y):
+		fighter = monster.fighter
+		#line of sight comes from the player's FOV, and is only worked out once a turn
+		(in_sight, dist) = fov.sight(objects, monster.id, player.x, player.y)
+		if in_sight and dist <= fighter.sight ** 2:
 			#if sees player, stores location
-			monster.fighter.lastx = player.x
-			monster.fighter.lasty = player.y
+			fighter.lastx = player.x
+			fighter.lasty = player.y
+			self.memory = MONSTER_MEMORY
 
-			if monster.distance_to(player) >= 2:
-				monster.fighter.move_towards(player.x, player.y)
+			if dist >= 2 ** 2:
+				fighter.move_towards(player.x, player.y)
 
 			elif player.fighter.hp > 0:
-				monster.fighter.attack(player)
+				fighter.attack(player)
+
+		elif self.memory > 0:
+			#lost sight of the player: work out the way to where they were last seen just once
+			#(again only if the path was thrown away), then keep following it
+			if ((self.memory == MONSTER_MEMORY or fighter.my_path is 0) and
+				not fighter.path_to(fighter.lastx, fighter.lasty)):
+				#no way there, or it's off the loaded window: give up, rather than walk on
+				#along whatever path was left from the chase
+				self.memory = 0
+			else:
+				self.memory -= 1
+				fighter.step_along_path()
+				if monster.x == fighter.lastx and monster.y == fighter.lasty:
+					self.memory = 0  #nobody here
+
+		else:
+			#nothing to do: doze off until the player comes near (see play_game)
+			objects.schedule.sleep(monster.id)
  
-class ConfusedMonster:
+class ConfusedMonster(entities.Slotted):
 	#AI for a temporarily confused monster (reverts to previous AI after a while).
+	__slots__ = ('old_ai', 'num_turns', 'owner')
+
 	def __init__(self, old_ai, num_turns=CONFUSE_NUM_TURNS):
 		self.old_ai = old_ai
 		self.num_turns = num_turns
@@ -336,8 +507,10 @@ class ConfusedMonster:
 			self.owner.ai = self.old_ai
 			message('The ' + self.owner.name + ' is no longer confused!', libtcod.red)
  
-class Item:
+class Item(entities.Slotted):
 	#an item that can be picked up and used.
+	__slots__ = ('use_function', 'owner')
+
 	def __init__(self, use_function=None):
 		self.use_function = use_function
  
@@ -380,8 +553,10 @@ class Item:
 			if self.use_function() != 'cancelled':
 				inventory.remove(self.owner)  #destroy after use, unless it was cancelled for some reason
  
-class Equipment:
+class Equipment(entities.Slotted):
 	#an object that can be equipped, yielding bonuses. automatically adds the Item component.
+	__slots__ = ('power_bonus', 'defense_bonus', 'max_hp_bonus', 'slot', 'is_equipped', 'owner')
+
 	def __init__(self, slot, power_bonus=0, defense_bonus=0, max_hp_bonus=0):
 		self.power_bonus = power_bonus
 		self.defense_bonus = defense_bonus
@@ -413,60 +588,6 @@ class Equipment:
 		message('Dequipped ' + self.owner.name + ' from ' + self.slot + '.', libtcod.light_yellow)
  
 
-def create_room(room):
-	global map
-	#go through the tiles in the rectangle and make them passable
-	for x in range(room.x1 + 1, room.x2):
-		for y in range(room.y1 + 1, room.y2):
-			map[x][y].blocked = False
-			map[x][y].block_sight = False
-
-def create_boundaries():
-	for y in range(MAP_HEIGHT):
-		map[0][y].blocked = True
-		map[0][y].block_sight = True
-		map[69][y].blocked = True
-		map[69][y].block_sight = True
-	for x in range(MAP_WIDTH):
-		map[x][0].blocked = True
-		map[x][0].block_sight = True
-		map[x][31].blocked = True
-		map[x][31].block_sight = True
-						#kludgy boundary because map is rubbish.
-
-def create_circular_room(room):
-	global map
-	#center of circle
-	cx = (room.x1 + room.x2) / 2
-	cy = (room.y1 + room.y2) / 2
-
-	#radius of circle: make it fit nicely inside the room, by making the
-	#radius be half the width or height (whichever is smaller)
-	width = room.x2 - room.x1
-	height = room.y2 - room.y1
-	r = min(width, height) / 1.8
-
-	#go through the tiles in the circle and make them passable
-	for x in range(room.x1, room.x2 + 1):
-		for y in range(room.y1, room.y2 + 1):
-			if math.sqrt((x - cx) ** 2 + (y - cy) ** 2) <= r:
-				map[x][y].blocked = False
-				map[x][y].block_sight = False
-
-def create_h_tunnel(x1, x2, y):
-	global map
-	#horizontal tunnel. min() and max() are used in case x1>x2
-	for x in range(min(x1, x2), max(x1, x2) + 1):
-		map[x][y].blocked = False
-		map[x][y].block_sight = False
-
-def create_v_tunnel(y1, y2, x):
-	global map
-	#vertical tunnel
-	for y in range(min(y1, y2), max(y1, y2) + 1):
-		map[x][y].blocked = False
-		map[x][y].block_sight = False
-
 def get_equipped_in_slot(slot):  #returns the equipment in a slot, or None if it's empty
 	for obj in inventory:
 		if obj.equipment and obj.equipment.slot == slot and obj.equipment.is_equipped:
@@ -489,20 +610,15 @@ def is_blocked(x, y):
 		return True
 
 	#now check for any blocking objects
-	for object in objects:
-		if object.blocks and object.x == x and object.y == y:
-			return True
-
-	return False
+	return free_tiles.occupied(x, y)
 
 def random_unblocked_tile_on_map():
-	tries = 1000
-	#1000 tries, and we'll punt - most probably producing an error in the calling code
-	for i in range(tries):
-		x = libtcod.random_get_int(0, 0, MAP_WIDTH - 1)
-		y = libtcod.random_get_int(0, 0, MAP_HEIGHT - 1)
-		if not is_blocked(x, y):
-			return x, y
+	#pick straight from the free tile index (which covers the FOV window); None only on a full map
+	return free_tiles.random_free()
+
+def random_reachable_tile(x, y):
+	#same, but only cells the player (or whoever is at x, y) can actually walk to
+	return free_tiles.random_reachable(x, y)
 
 def sightblocked (x, y):
 	map[x][y].block_sight = True
@@ -523,7 +639,7 @@ def move_camera(target_x, target_y):
 	if x != camera_x or y != camera_y: fov_recompute = True
 
 	(camera_x, camera_y) = (x, y)
-	initialize_fov()
+	stream_chunks()
 
 def to_camera_coordinates(x, y):
 	#convert coordinates on the map to coordinates on the screen
@@ -534,6 +650,58 @@ def to_camera_coordinates(x, y):
 
 	return (x, y)
 
+def in_fov(x, y):
+	#is the map cell visible to the player? looked up in the copy of the last FOV computation
+	return fov.visible(x, y)
+
+def set_fov_properties(x, y, transparent, walkable):
+	x -= fov_x
+	y -= fov_y
+	if 0 <= x < fov_width and 0 <= y < fov_height:
+		libtcod.map_set_properties(fov_map, x, y, transparent, walkable)
+
+def stream_chunks():
+	#load the chunks around the player, park the ones far away and rebuild the FOV map
+	#whenever the loaded window moves. plain (hub) maps are always fully loaded.
+	if not isinstance(map, chunks.ChunkedMap):
+		return
+
+	area = map.active
+	map.load_area(player.x - CAMERA_WIDTH / 2 - CHUNK_LOAD_MARGIN, player.y - CAMERA_HEIGHT / 2 - CHUNK_LOAD_MARGIN,
+				  player.x + CAMERA_WIDTH / 2 + CHUNK_LOAD_MARGIN, player.y + CAMERA_HEIGHT / 2 + CHUNK_LOAD_MARGIN)
+
+	#park the objects standing on far away chunks along with their tiles
+	for key in map.far_chunks(CHUNK_EVICT_DISTANCE):
+		(x, y, w, h) = map.chunk_rect(key)
+		parked = [obj for obj in objects if x <= obj.x < x + w and y <= obj.y < y + h and
+				  obj is not player and obj is not stairs and obj is not upstairs]
+		for obj in parked:
+			if obj.blocks:
+				free_tiles.unblock(obj.x, obj.y)
+			if obj.fighter and obj.fighter.my_path is not 0:
+				libtcod.path_delete(obj.fighter.my_path)
+				obj.fighter.my_path = 0
+		objects.remove_many(parked)
+		map.evict(key, parked)
+
+	for chunk in map.take_loaded():
+		if chunk.fresh:
+			#first visit: fill the rooms the generator carved
+			chunk.fresh = False
+			for room in chunk.rooms:
+				place_objects(room)
+				place_monsters(room)
+		else:
+			#coming back: put the parked objects back, below everything else
+			objects.insert_many(0, chunk.objects)
+			for obj in chunk.objects:
+				if obj.blocks:
+					free_tiles.block(obj.x, obj.y)
+			chunk.objects = []
+
+	if map.active != area:
+		initialize_fov()
+
 class MonsterDataListener:
 	def new_struct(self, struct, name):
 		global monster_data
@@ -564,47 +732,28 @@ class MonsterDataListener:
 		return True
 
 def make_map():
-	global map, objects, stairs, upstairs, factorystairs, factoryexitstairs, MAP_HEIGHT, MAP_WIDTH, color_dark_wall, color_light_wall,color_dark_ground, color_light_ground
+	global map, objects, stairs, upstairs, factorystairs, factoryexitstairs, MAP_HEIGHT, MAP_WIDTH, theme
+	global fov_cache, explored
 
 
 	#the list of objects with just the player
-	objects = [player]
+	objects = entities.World([player])
 
 	if dungeon_level == 1:
-		#use custom map from samples
-		maps.hubmap
-		color_dark_wall = libtcod.Color(50, 50, 50)
-		color_light_wall = libtcod.Color(100, 100, 100)
-		color_dark_ground = libtcod.Color(22, 22, 22)
-		color_light_ground = libtcod.Color(42, 42, 42)
+		#use custom map from samples, precompiled by staticmaps.py
+		hubmap = staticmaps.load('hubmap')
+		theme = THEMES['hub']
 
 		#NOTE: height and width should really be lower-cased, since we are not treating them as constants anymore
-		MAP_HEIGHT = len(maps.hubmap)
-		MAP_WIDTH = len(maps.hubmap[0])
-
-		#declare variable 'map' and fill it with blocked tilesc
-		map = [[Tile(True, sludge=False, bar=False, door=False, space=False) for y in range(MAP_HEIGHT)] for x in range(MAP_WIDTH)]
-		for y in range(MAP_HEIGHT):
-			for x in range(MAP_WIDTH):
-				if maps.hubmap[y][x] == ' ':
-					map[x][y] = Tile(False, False, False, False, False)
-
-				elif maps.hubmap[y][x] == '~':
-					map[x][y] = Tile(False, True, False, False, False)
-					libtcod.console_set_char(con,x,y,172)
-
-				elif maps.hubmap[y][x] == '_':
-					map[x][y] = Tile(False, False, True, False, False)
-
-				elif maps.hubmap[y][x] == 'X':
-					map[x][y] = Tile(False, False, False, True, False)
-
-				elif maps.hubmap[y][x] == 'W':
-					map[x][y] = Tile(False, False, False, False, True)
-					libtcod.console_set_char(con,x,y,171)
-
+		MAP_HEIGHT = hubmap.height
+		MAP_WIDTH = hubmap.width
 
+		map = hubmap.build(Tile)
 
+		#the hub never changes, so its FOV only needs working out once for every spot
+		fov_cache = None
+		if CACHE_HUB_FOV:
+			fov_cache = visibility.FovCache()
 
 		#upstairs = Object(2, 3, '>', 'upstairs', libtcod.white, always_visible=True)
 		#objects.append(upstairs)
@@ -618,92 +767,97 @@ def make_map():
 
 
 	else:
-	#fill map with "blocked" tiles
-		color_dark_wall = libtcod.Color(0, 0, 10)
-		color_light_wall = libtcod.Color(50, 50, 50)
-		color_dark_ground = libtcod.Color(0, 0, 0)
-		color_light_ground = libtcod.Color(22, 22, 22)
-
-		map = [[Tile(True, False, False, False, False)
-				for y in range(MAP_HEIGHT)]
-			   for x in range(MAP_WIDTH)]
-
-		rooms = []
-		num_rooms = 0
-
-		for r in range(MAX_ROOMS):
-			#random width and height
-			w = libtcod.random_get_int(0, ROOM_MIN_SIZE, ROOM_MAX_SIZE)
-			h = libtcod.random_get_int(0, ROOM_MIN_SIZE, ROOM_MAX_SIZE)
-			#random position without going out of the boundaries of the map
-			x = libtcod.random_get_int(0, 0, MAP_WIDTH - w - 1)
-			y = libtcod.random_get_int(0, 0, MAP_HEIGHT - h - 1)
-
-			#"Rect" class makes rectangles easier to work with
-			new_room = Rect(x, y, w, h)
-
-			#run through the other rooms and see if they intersect with this one
-			failed = False
-			for other_room in rooms:
-				if new_room.intersect(other_room):
-					failed = True
-					break
-
-			if not failed:
-				#this means there are no intersections, so this room is valid
-
-				#"paint" it to the map's tiles8
-				roomchoice = [create_circular_room(new_room), create_room(new_room)]
-				random.choice(roomchoice)
-				create_circular_room(new_room)
-				create_boundaries()
-
-				#add some contents to this room
-				place_objects(new_room)
-
-				#add furniture
-				#place_furniture(new_room)
-
-				#add monsters
-				place_monsters(new_room)
-
-				#center coordinates of new room, will be useful later
-				(new_x, new_y) = new_room.center()
-
-				if num_rooms == 0:
-					#this is the first room, where the player starts at
-					player.x = new_x
-					player.y = new_y
-				else:
-					#all rooms after the first:
-					#connect it to the previous room with a tunnel
-
-					#center coordinates of previous room
-					(prev_x, prev_y) = rooms[num_rooms - 1].center()
-
-					#draw a coin (random number that is either 0 or 1)
-					if libtcod.random_get_int(0, 0, 1) == 1:
-						#first move horizontally, then vertically
-						create_h_tunnel(prev_x, new_x, prev_y)
-						create_v_tunnel(prev_y, new_y, new_x)
-					else:
-						#first move vertically, then horizontally
-						create_v_tunnel(prev_y, new_y, prev_x)
-						create_h_tunnel(prev_x, new_x, new_y)
-
-				#finally, append the new room to the list
-				rooms.append(new_room)
-				num_rooms += 1
+		theme = THEMES['derelict']
+
+		fov_cache = None
+
+		#the derelict is only carved chunk by chunk as the player gets near (see generate_chunk)
+		map = chunks.ChunkedMap(DERELICT_CHUNKS_WIDE, DERELICT_CHUNKS_HIGH, generate_chunk,
+								seed=libtcod.random_get_int(0, 0, 0x7fffffff))
+		MAP_WIDTH = map.width
+		MAP_HEIGHT = map.height
 
+		#the player comes aboard in the middle of the ship
+		(start_cx, start_cy) = (DERELICT_CHUNKS_WIDE / 2, DERELICT_CHUNKS_HIGH / 2)
+		(player.x, player.y) = map.chunk(start_cx, start_cy).rooms[0].center()
+
+		#the way down is a few chunks away, in the last room carved there
+		stairs_cx = min(start_cx + DERELICT_STAIRS_DISTANCE, DERELICT_CHUNKS_WIDE - 1)
+		(new_x, new_y) = map.chunk(stairs_cx, start_cy).rooms[-1].center()
 		stairs = Object(new_x, new_y, '<', 'stairs', libtcod.white, always_visible=True)
 		objects.append(stairs)
 		stairs.send_to_back()  #so it's drawn below the monsters
 
-		upstairs = Object(new_x, new_y, '>', 'upstairs', libtcod.white, always_visible=True)
-		upstairs.x, upstairs.y = random_unblocked_tile_on_map()
+		upstairs = None
+		stream_chunks()
+
+		upstairs = Object(player.x, player.y, '>', 'upstairs', libtcod.white, always_visible=True)
+		upstairs.x, upstairs.y = random_reachable_tile(player.x, player.y)
 		objects.append(upstairs)
 		upstairs.send_to_back()  #so it's drawn below the monsters
 
+	#nothing seen yet
+	explored = visibility.Explored(MAP_WIDTH, MAP_HEIGHT, chunks.CHUNK_SIZE)
+
+def generate_chunk(chunked, cx, cy, rng):
+	#carve one chunk of a derelict: rooms joined one after the other, plus corridors from
+	#the first room to the middle of every edge shared with a neighbour, where they meet its own
+	size = chunked.chunk_size
+	mask = carving.Mask(size, size)
+
+	rooms = []
+	for r in range(CHUNK_MAX_ROOMS):
+		#random width and height
+		w = rng.randint(ROOM_MIN_SIZE, ROOM_MAX_SIZE)
+		h = rng.randint(ROOM_MIN_SIZE, ROOM_MAX_SIZE)
+		#random position, leaving the chunk's outer ring alone so the hull stays closed
+		x = rng.randint(1, size - w - 2)
+		y = rng.randint(1, size - h - 2)
+
+		new_room = Rect(x, y, w, h)
+		failed = False
+		for other_room in rooms:
+			if new_room.intersect(other_room):
+				failed = True
+				break
+		if failed:
+			continue
+
+		rng.choice([mask.room, mask.circular_room])(new_room)
+		(new_x, new_y) = new_room.center()
+		if rooms:
+			#connect it to the previous room with a tunnel
+			(prev_x, prev_y) = rooms[-1].center()
+			if rng.randint(0, 1) == 1:
+				mask.h_tunnel(prev_x, new_x, prev_y)
+				mask.v_tunnel(prev_y, new_y, new_x)
+			else:
+				mask.v_tunnel(prev_y, new_y, prev_x)
+				mask.h_tunnel(prev_x, new_x, new_y)
+		rooms.append(new_room)
+
+	(x, y) = rooms[0].center()
+	mid = size / 2
+	if cx > 0:
+		mask.v_tunnel(y, mid, x)
+		mask.h_tunnel(0, x, mid)
+	if cx < chunked.chunks_wide - 1:
+		mask.v_tunnel(y, mid, x)
+		mask.h_tunnel(x, size - 1, mid)
+	if cy > 0:
+		mask.h_tunnel(x, mid, y)
+		mask.v_tunnel(0, y, mid)
+	if cy < chunked.chunks_high - 1:
+		mask.h_tunnel(x, mid, y)
+		mask.v_tunnel(y, size - 1, mid)
+
+	#only now are the tiles made, in one go
+	tiles = mask.to_tiles(lambda floor: Tile(not floor, False, False, False, False))
+
+	#rooms are handed back in map coordinates, ready for place_objects() and place_monsters()
+	(ox, oy) = (cx * size, cy * size)
+	return (tiles, [Rect(room.x1 + ox, room.y1 + oy, room.x2 - room.x1, room.y2 - room.y1) for room in rooms])
+
 def hub():
 	#Shops
 	furniture_component = Furniture(use_function=Ermashopsell)
@@ -748,12 +902,12 @@ def hub():
 	#							 blocks=True, nonplayerchar=nonplayerchar_component, ai=ai_component)
 	#	objects.append(npc)
 
+	libtcod.namegen_parse('npcattrib.txt')  #the NPC grammars, once for all of them
+	libtcod.namegen_parse('colours.txt')
 	for n in range(1,30):
-		libtcod.namegen_parse('npcattrib.txt')
 		name = libtcod.namegen_generate('npcnames')
 		clothes = libtcod.namegen_generate('clothes')
 		features = libtcod.namegen_generate('features')
-		libtcod.namegen_parse('colours.txt')
 		colours = libtcod.namegen_generate('colours')
 
 		nonplayerchar_component = NonplayerChar(my_path=0, lastx=0, lasty=0,  setx=0, sety=0, destset=False, hp=20, defense=10, strength=4, hack=0, dexterity=10, perception=4,
@@ -829,58 +983,31 @@ def hub():
 	player.x, player.y = 62, 22
 
 
-def random_choice_index(chances):  #choose one option from list of chances, returning its index
-	#the dice will land on some number between 1 and the sum of the chances
-	dice = libtcod.random_get_int(0, 1, sum(chances))
- 
-	#go through all chances, keeping the sum so far
-	running_sum = 0
-	choice = 0
-	for w in chances:
-		running_sum += w
- 
-		#see if the dice landed in the part that corresponds to this choice
-		if dice <= running_sum:
-			return choice
-		choice += 1
- 
-def random_choice(chances_dict):
-	#choose one option from dictionary of chances, returning its key
-	chances = chances_dict.values()
-	strings = chances_dict.keys()
- 
-	return strings[random_choice_index(chances)]
- 
 def from_dungeon_level(table):
 	#returns a value that depends on level. the table specifies what value occurs after each level, default is 0.
-	for (value, level) in reversed(table):
-		if dungeon_level >= level:
-			return value
-	return 0
+	return randomtables.from_level(table, dungeon_level)
 
 def place_monsters(room):
 	max_monsters = from_dungeon_level([[2, 1], [3, 5], [4, 8]])
-	#chance of each monster
-	monster_chances ={}
-	monster_chances['Mutant'] = from_dungeon_level([[80, 2], [40, 5], [10,9], [0, 12]])   #thug always shows up, even if all other monsters have 0 chance
-	monster_chances['Abomination'] = from_dungeon_level([[10, 3], [15, 5], [10, 7], [0,12]])
 
-	#choose random number of monsters
+	#choose random number of monsters, and draw them all from this level's table at once
 	num_monsters = libtcod.random_get_int(0, 0, max_monsters)
+	choices = SPAWN_TABLES.at_level(dungeon_level)['monsters'].sample(num_monsters)
 
-	for i in range(num_monsters):
+	for choice in choices:
 		#choose random spot for this monster
 		x = libtcod.random_get_int(0, room.x1 + 1, room.x2 - 1)
 		y = libtcod.random_get_int(0, room.y1 + 1, room.y2 - 1)
 
 		#only place it if the tile is not blocked
 		if not is_blocked(x, y):
-			choice = random_choice(monster_chances)
 			tmpData = monster_data[choice]
-			fighter_component = Fighter(my_path=0, lastx=0, lasty=0,  hp=tmpData['hp'], defense=tmpData['defense'], power=tmpData['power'], xp=tmpData['xp'], flicker=0, death_function=tmpData['death_function'])
+			fighter_component = Fighter(my_path=0, lastx=0, lasty=0,  hp=tmpData['hp'], defense=tmpData['defense'], power=tmpData['power'], xp=tmpData['xp'], flicker=0, death_function=tmpData['death_function'],
+										speed=tmpData.get('speed', scheduler.NORMAL_SPEED), sight=tmpData.get('sight', TORCH_RADIUS))
 			ai_component = BasicMonster()
 			monster = Object(x, y, tmpData['character'], tmpData['name'], tmpData['character_color'], tmpData['desc'], blocks=True, fighter=fighter_component, ai=ai_component)
 			objects.append(monster)
+			free_tiles.block(x, y)
 
 def place_objects(room):
 	#this is where we decide the chance of each monster or item appearing.
@@ -893,26 +1020,17 @@ def place_objects(room):
 	#maximum number of items per room
 	max_items = from_dungeon_level([[1, 1], [2, 4]])
  
-	#chance of each item (by default they have a chance of 0 at level 1, which then goes up)
-	item_chances = {}
-	item_chances['heal'] = 35  #healing potion always shows up, even if all other items have 0 chance
-	item_chances['lightning'] = from_dungeon_level([[25, 4]])
-	item_chances['fireball'] =  from_dungeon_level([[25, 6]])
-	item_chances['confuse'] =   from_dungeon_level([[10, 2]])
-	item_chances['sword'] =     from_dungeon_level([[5, 4]])
-	item_chances['shield'] =    from_dungeon_level([[15, 8]])
- 
-	#choose random number of items
+	#chance of each item: see SPAWN_TABLES. choose random number of items, and draw them all at once
 	num_items = libtcod.random_get_int(0, 0, max_items)
+	choices = SPAWN_TABLES.at_level(dungeon_level)['items'].sample(num_items)
  
-	for i in range(num_items):
+	for choice in choices:
 		#choose random spot for this item
 		x = libtcod.random_get_int(0, room.x1+1, room.x2-1)
 		y = libtcod.random_get_int(0, room.y1+1, room.y2-1)
  
 		#only place it if the tile is not blocked
 		if not is_blocked(x, y):
-			choice = random_choice(item_chances)
 			if choice == 'heal':
 				#create a healing potion
 				item_component = Item(use_function=cast_heal)
@@ -973,8 +1091,9 @@ def get_names_under_mouse():
 	(x, y) = (mouse.cx, mouse.cy)
  
 	#create a list with the names of all objects at the mouse's coordinates and in FOV
-	names = [obj.name for obj in objects
-			 if obj.x == x and obj.y == y and libtcod.map_is_in_fov(fov_map, obj.x, obj.y)]
+	if not in_fov(x, y):
+		return ''
+	names = [obj.name for obj in objects if obj.x == x and obj.y == y]
  
 	names = ', '.join(names)  #join the names, separated by commas
 	return names.capitalize()
@@ -985,107 +1104,118 @@ def flicker_all():
 	timer = 0
 	while (timer < 3):
 		for frame in range(5):
-			for object in objects:
-				if object.fighter and libtcod.map_is_in_fov(fov_map, object.x, object.y) and object.fighter.flicker is not None:
+			for id in fov.visible_ids(objects, objects.fighters.ids):
+				object = objects.entities[id]
+				if object.fighter.flicker is not None:
 					#if object.fighter.robot:
 					#	libtcod.console_set_char_foreground(con, object.x, object.y, libtcod.light_blue)
 					#	libtcod.console_blit(con, 0, 0, MAP_WIDTH, MAP_HEIGHT, 0, 0, 0)
 					#else:
-					libtcod.console_set_char_foreground(con, object.x, object.y, libtcod.dark_red)
-					libtcod.console_blit(con, 0, 0, MAP_WIDTH, MAP_HEIGHT, 0, 0, 0)
+					(x, y) = to_camera_coordinates(object.x, object.y)
+					if x is not None:
+						libtcod.console_set_char_foreground(con, x, y, libtcod.dark_red)
+					libtcod.console_blit(con, 0, 0, CAMERA_WIDTH, CAMERA_HEIGHT, 0, 0, 0)
 		libtcod.console_check_for_keypress()
 		#render_all()
 		libtcod.console_flush()#show result
 		timer += 1
 	fov_recompute = True
 	render_all()
-	for object in objects:
-		if object.fighter:
-			object.fighter.flicker = None
+	for object in objects.with_fighter():
+		object.fighter.flicker = None
 
 def render_all():
-	global fov_map, color_dark_wall, color_light_wall
-	global color_dark_ground, color_light_ground
-	global fov_recompute, hour, day, amorpm, playername, inventory, dungeon_name
+	global fov_map
+	global map_redraw, hour, day, amorpm, playername, inventory, dungeon_name
 	#plyx = player.x + 2
 	#plyy = player.y + 2
-	move_camera(player.x, player.y)
+	update_fov()
 	#floordirt = 12;
 	#noise2d = libtcod.noise_new(2,h=libtcod.NOISE_DEFAULT_HURST,l=libtcod.NOISE_DEFAULT_LACUNARITY,random=0)
 
-	if fov_recompute:
-		#recompute FOV if needed (the player moved or something)
-		fov_recompute = False
-		libtcod.map_compute_fov(fov_map, player.x, player.y, TORCH_RADIUS, FOV_LIGHT_WALLS, FOV_ALGO)
-		libtcod.console_clear(con)
+	if map_redraw:
+		#the FOV changed since the map was last drawn: paint the tiles into map_tiles, which
+		#every frame starts from
+		map_redraw = False
+		map_tiles.clear()
+		set_fore = map_tiles.set_fore
+		glyph = libtcod.white  #color of the sludge and space glyphs
+
+		def decorate(x, y, map_x, map_y):
+			#the decoration of a cell, from the level's glyph layer
+			char = decorations.get((map_x, map_y))
+			if char is not None:
+				set_fore(x, y, glyph.r, glyph.g, glyph.b, chr(char))
+
+		#colors go straight into the buffer's channels: flat ones from the theme's (r, g, b)
+		#tuples, lit ones out of its shade tables by the light map's totals, so painting a
+		#cell makes no tuples or Colors
+		(back_r, back_g, back_b) = (map_tiles.back_r, map_tiles.back_g, map_tiles.back_b)
+		(light_r, light_g, light_b) = lights.total
+		(wall_shades, ground_shades) = (theme.shades['wall'], theme.shades['ground'])
+		(dark_wall, dark_ground) = (theme.rgb['dark_wall'], theme.rgb['dark_ground'])
+		(sludge_color, space_color) = (theme.rgb['sludge'], theme.rgb['space'])
 
 		#go through all tiles, and set their background color according to the FOV
+		is_visible = fov.visible
+		is_explored = explored.is_explored
+		j = 0  #the cell in map_tiles
 		for y in range(CAMERA_HEIGHT):
+			map_y = camera_y + y
+			row = (map_y - lights.y0) * lights.width - lights.x0  #add map_x for the cell in the light map
 			for x in range(CAMERA_WIDTH):
-				(map_x, map_y) = (camera_x + x, camera_y + y)
-				visible = libtcod.map_is_in_fov(fov_map, map_x, map_y)
+				map_x = camera_x + x
+				visible = is_visible(map_x, map_y)
 
 				wall = map[map_x][map_y].block_sight
 				sludge = map[map_x][map_y].sludge
 				water = map[map_x][map_y].space
 
+				color = None
 				if not visible:
 					#if it's not visible right now, the player can only see it if it's explored
-					if map[map_x][map_y].explored:
+					if is_explored(map_x, map_y):
 						if wall:
-							libtcod.console_set_char_background(con, x, y, color_dark_wall, libtcod.BKGND_SET)
+							color = dark_wall
 						elif sludge:
-							libtcod.console_set_char_background(con, x, y, libtcod.darkest_lime, libtcod.BKGND_SET)
-
+							color = sludge_color
 						elif water:
-							libtcod.console_set_char_background(con, x, y, libtcod.darkest_blue, libtcod.BKGND_SET)
-							libtcod.console_set_char(con,x,y,171)
+							color = space_color
+							decorate(x, y, map_x, map_y)
 						else:
-							libtcod.console_set_char_background(con, x, y, color_dark_ground, libtcod.BKGND_SET)
-
+							color = dark_ground
+
+				elif sludge and not wall:
+					color = sludge_color
+					decorate(x, y, map_x, map_y)
+				elif water and not wall:
+					color = space_color
+					decorate(x, y, map_x, map_y)
 				else:
-					#it's visible
-					if wall:
-						libtcod.console_set_char_background(con, x, y, color_light_wall, libtcod.BKGND_SET)
-					elif sludge:
-						libtcod.console_set_char_background(con, x, y, libtcod.darkest_lime, libtcod.BKGND_SET)
-						libtcod.console_set_char(con,x,y,172)
-					elif water:
-						libtcod.console_set_char_background(con, x, y, libtcod.darkest_blue, libtcod.BKGND_SET)
-						libtcod.console_set_char(con,x,y,171)
-					else:
-						libtcod.console_set_char_background(con, x, y, color_light_ground, libtcod.BKGND_SET)
-
-
-						#since it's visible, explore it
-					map[map_x][map_y].explored = True
-
+					#it's visible, and as bright as the light on it
+					i = row + map_x
+					(shade_r, shade_g, shade_b) = wall_shades if wall else ground_shades
+					back_r[j] = shade_r[light_r[i]]
+					back_g[j] = shade_g[light_g[i]]
+					back_b[j] = shade_b[light_b[i]]
 
+				if color is not None:
+					(back_r[j], back_g[j], back_b[j]) = color
+				j += 1
 
 	#draw all objects in the list, except the player. we want it to
 	#always appear over all other objects! so it's drawn later.
-	for object in objects:
+	for object in fov.visible_objects(objects):
 		if object != player:
 			object.draw()
 	player.draw()
 
+	#the frame is the tiles with the glyphs on top, sent to the map console in one blit
+	map_frame.set_region(0, 0, map_tiles)
+	glyphs.flush(map_frame)
+	map_frame.blit(con)
 
-
-	#prepare to render the GUI panel
-	libtcod.console_set_default_background(panel, libtcod.black)
-	libtcod.console_clear(panel)
-	libtcod.console_print_frame(panel, 0, 0, 43, PANEL_HEIGHT, clear=False, flag=libtcod.BKGND_ADD, fmt=0)
-
-
-
-	#print the game messages, one line at a time
-	y = 1
-	x = 1
-	libtcod.console_print_ex(panel, 1, 0, libtcod.BKGND_NONE, libtcod.LEFT,  str(dungeon_name))
-	for (line, color) in game_msgs:
-		libtcod.console_set_default_foreground(panel, color)
-		libtcod.console_print_ex(panel, x, y, libtcod.BKGND_NONE, libtcod.LEFT, line)
-		y += 1
+	render_panel()
 
 	#show the player's stats
 
@@ -1130,10 +1260,14 @@ def render_all():
 	# libtcod.console_print_ex(sidebar, 1, 33, libtcod.BKGND_NONE, libtcod.LEFT, '4:' + str(get_equipped_in_slot('Right Hand')))
 	libtcod.console_set_default_foreground(sidebar, libtcod.light_grey)
 
+	if DEBUG:
+		#how many monsters were simulated last turn, and how many are on the level
+		libtcod.console_print_rect_ex(sidebar, 1, SIDEBAR_HEIGHT - 6, SIDEBAR_WIDTH - 2, 5, libtcod.BKGND_NONE, libtcod.LEFT,
+									  'Actors: ' + objects.schedule.stats())
+		#off-screen consoles handed out and not given back: this should stay at the menus cached
+		libtcod.console_print_rect_ex(sidebar, 1, SIDEBAR_HEIGHT - 9, SIDEBAR_WIDTH - 2, 3, libtcod.BKGND_NONE, libtcod.LEFT,
+									  'Consoles: ' + console_pool.stats())
 
-	#display names of objects under the mouse
-	libtcod.console_set_default_foreground(panel, libtcod.light_gray)
-	libtcod.console_print_ex(panel, 1, 0, libtcod.BKGND_NONE, libtcod.LEFT, get_names_under_mouse())
 
 	#blit the contents of "panel" to the root console
 	libtcod.console_blit(panel, 0, 0, SCREEN_WIDTH, PANEL_HEIGHT, 0, 0, PANEL_Y, 0.94, 0.2)
@@ -1142,20 +1276,141 @@ def render_all():
 
 
 #blit the contents of "con" to the root console
-	libtcod.console_blit(con, 0, 0, MAP_WIDTH, MAP_HEIGHT, 0, 0, 0, 1, 1)
+	libtcod.console_blit(con, 0, 0, CAMERA_WIDTH, CAMERA_HEIGHT, 0, 0, 0, 1, 1)
+
+	#the minimap goes straight on the root console, so the sidebar's fading doesn't dim it
+	update_minimap()
+	level_minimap.draw(0, MINIMAP_X, MINIMAP_Y, MINIMAP_WIDTH, MINIMAP_HEIGHT, player.x, player.y, libtcod.white)
+
+def update_fov():
+	#follow the player with the camera, and recompute FOV if needed (the player moved or
+	#something). runs without drawing anything, so steps taken between frames keep it up to date
+	global fov_recompute, map_redraw
+	move_camera(player.x, player.y)
+	if fov_recompute:
+		fov_recompute = False
+		fov.compute(fov_map, player.x, player.y, TORCH_RADIUS, SIGHT_RADIUS, FOV_LIGHT_WALLS, FOV_ALGO)
+		explored.add_view(fov)  #whatever is in view is explored now, on screen or not
+		(torch.x, torch.y) = (player.x, player.y)
+		lights.cast_torch(torch, fov)
+		map_redraw = True
+
+def render_panel():
+	#the GUI panel only needs printing again when a message came in or the names under the mouse changed
+	global panel_shown
+	names = get_names_under_mouse()
+	if not game_msgs.dirty and panel_shown == (names, dungeon_name):
+		return
+	game_msgs.dirty = False
+	panel_shown = (names, dungeon_name)
+
+	#prepare to render the GUI panel
+	libtcod.console_set_default_background(panel, libtcod.black)
+	libtcod.console_clear(panel)
+	libtcod.console_print_frame(panel, 0, 0, 43, PANEL_HEIGHT, clear=False, flag=libtcod.BKGND_ADD, fmt=0)
+
+	#print the game messages, one line at a time
+	y = 1
+	x = 1
+	libtcod.console_print_ex(panel, 1, 0, libtcod.BKGND_NONE, libtcod.LEFT,  str(dungeon_name))
+	for (line, color) in game_msgs.lines(MSG_WIDTH, MSG_HEIGHT):
+		libtcod.console_set_default_foreground(panel, color)
+		libtcod.console_print_ex(panel, x, y, libtcod.BKGND_NONE, libtcod.LEFT, line)
+		y += 1
+
+	#display names of objects under the mouse
+	libtcod.console_set_default_foreground(panel, libtcod.light_gray)
+	libtcod.console_print_ex(panel, 1, 0, libtcod.BKGND_NONE, libtcod.LEFT, names)
+
+def update_minimap():
+	#paint the cells explored since last time. a new level (or a loaded game) gets a new
+	#minimap, painted with everything explored so far
+	global level_minimap
+	if level_minimap is None or level_minimap.explored is not explored:
+		if level_minimap is not None:
+			level_minimap.delete()
+		#the whole level fits the overview screen (less its bottom line)
+		level_minimap = minimap.Minimap(explored, 2 * SCREEN_WIDTH, 2 * (SCREEN_HEIGHT - 1), MINIMAP_LEAST_SCALE)
+		explored.take_fresh()
+		cells = explored.cells()
+	else:
+		cells = explored.take_fresh()
+	if cells:
+		level_minimap.paint(minimap_pixels(cells))
+
+def minimap_pixels(cells):
+	#(x, y, color, rank) for some explored cells (see minimap.py). the tiles of a derelict are taken chunk by chunk,
+	#without loading the parked ones
+	if isinstance(map, chunks.ChunkedMap):
+		size = map.chunk_size
+		cells = sorted(cells, key=lambda cell: (cell[0] // size, cell[1] // size))
+		(key, tiles) = (None, None)
+	pixels = []
+	for (x, y) in cells:
+		if isinstance(map, chunks.ChunkedMap):
+			if (x // size, y // size) != key:
+				key = (x // size, y // size)
+				tiles = map.peek(*key)
+			if tiles is None:
+				continue
+			tile = tiles[x % size][y % size]
+		else:
+			tile = map[x][y]
+
+		if tile.block_sight:
+			pixels.append((x, y, minimap_wall, minimap.WALL))
+		elif tile.sludge:
+			pixels.append((x, y, libtcod.darkest_lime, minimap.FLOOR))
+		elif tile.space:
+			pixels.append((x, y, libtcod.darkest_blue, minimap.FLOOR))
+		else:
+			pixels.append((x, y, minimap_ground, minimap.FLOOR))
+	return pixels
+
+def show_overview():
+	#the minimap, blown up to the whole screen, until a key is pressed
+	update_minimap()
+	libtcod.console_clear(0)
+	level_minimap.draw(0, 0, 0, SCREEN_WIDTH, SCREEN_HEIGHT, player.x, player.y, libtcod.white)
+	libtcod.console_print_ex(0, SCREEN_WIDTH / 2, SCREEN_HEIGHT - 1, libtcod.BKGND_NONE, libtcod.CENTER, str(dungeon_name))
+	libtcod.console_flush()
+	libtcod.console_wait_for_keypress(True)
  
  
 def message(new_msg, color = libtcod.white):
-	#split the message if necessary, among multiple lines
-	new_msg_lines = textwrap.wrap(new_msg, MSG_WIDTH)
- 
-	for line in new_msg_lines:
-		#if the buffer is full, remove the first line to make room for the new one
-		if len(game_msgs) == MSG_HEIGHT:
-			del game_msgs[0]
- 
-		#add the new line as a tuple, with the text and the color
-		game_msgs.append( (line, color) )
+	#into the log; it's only split among multiple lines when it gets drawn (see messages.py)
+	game_msgs.add(new_msg, color)
+
+def show_history():
+	#scroll back through the message log with the arrow keys, any other key closes it
+	(width, height) = (SCREEN_WIDTH - 2, SCREEN_HEIGHT - 2)
+	window = console_pool.take(SCREEN_WIDTH, SCREEN_HEIGHT)
+	scroll = 0
+	most = max(0, game_msgs.line_count(width) - height)
+	while True:
+		libtcod.console_clear(window)
+		libtcod.console_set_default_foreground(window, libtcod.white)
+		libtcod.console_print_frame(window, 0, 0, SCREEN_WIDTH, SCREEN_HEIGHT, clear=False, flag=libtcod.BKGND_SET, fmt='Messages')
+		y = 1
+		for (line, color) in game_msgs.lines(width, height, scroll):
+			libtcod.console_set_default_foreground(window, color)
+			libtcod.console_print_ex(window, 1, y, libtcod.BKGND_NONE, libtcod.LEFT, line)
+			y += 1
+		libtcod.console_blit(window, 0, 0, SCREEN_WIDTH, SCREEN_HEIGHT, 0, 0, 0)
+		libtcod.console_flush()
+
+		key = libtcod.console_wait_for_keypress(True)
+		if key.vk == libtcod.KEY_UP or key.vk == libtcod.KEY_KP8:
+			scroll = min(scroll + 1, most)
+		elif key.vk == libtcod.KEY_DOWN or key.vk == libtcod.KEY_KP2:
+			scroll = max(scroll - 1, 0)
+		elif key.vk == libtcod.KEY_PAGEUP or key.vk == libtcod.KEY_KP9:
+			scroll = min(scroll + height, most)
+		elif key.vk == libtcod.KEY_PAGEDOWN or key.vk == libtcod.KEY_KP3:
+			scroll = max(scroll - height, 0)
+		else:
+			break
+	console_pool.give(window)
 
  
 def player_move_or_attack(dx, dy):
@@ -1167,14 +1422,15 @@ def player_move_or_attack(dx, dy):
  
 	#try to find an attackable object there
 	target = None
-	for object in objects:
-		if object.fighter and object.x == x and object.y == y:
-			target = object
+	for id in objects.fighters.ids:
+		if objects.x[id] == x and objects.y[id] == y:
+			target = objects.entities[id]
 			break
  
 	#attack if target found, move otherwise
 	if target is not None:
 		player.fighter.attack(target)
+		make_noise(x, y, COMBAT_NOISE_RADIUS)
 	else:
 		player.move(dx, dy)
 		fov_recompute = True
@@ -1192,22 +1448,24 @@ def menu(header, options, width):
 		header_height = 0
 	height = len(options) + header_height
 
-	#create an off-screen console that represents the menu's window
-	window = libtcod.console_new(width, height+6)
-	libtcod.console_set_alignment(window, libtcod.RIGHT)
+	def draw(window):
+		libtcod.console_set_alignment(window, libtcod.RIGHT)
 
-	#print the header, with auto-wrap
-	libtcod.console_set_default_foreground(window, libtcod.green)
-	libtcod.console_print_rect_ex(window, 0, 0, width, height, libtcod.BKGND_ADD, libtcod.LEFT, header)
+		#print the header, with auto-wrap
+		libtcod.console_set_default_foreground(window, libtcod.green)
+		libtcod.console_print_rect_ex(window, 0, 0, width, height, libtcod.BKGND_ADD, libtcod.LEFT, header)
 
-	#print all the options
-	y = header_height
-	letter_index = ord('a')
-	for option_text in options:
-		text = '(' + chr(letter_index) + ') ' + option_text
-		libtcod.console_print_ex(window, 0, y, libtcod.BKGND_ADD, libtcod.LEFT, text)
-		y += 1
-		letter_index += 1
+		#print all the options
+		y = header_height
+		letter_index = ord('a')
+		for option_text in options:
+			text = '(' + chr(letter_index) + ') ' + option_text
+			libtcod.console_print_ex(window, 0, y, libtcod.BKGND_ADD, libtcod.LEFT, text)
+			y += 1
+			letter_index += 1
+
+	#the off-screen console that represents the menu's window, drawn already if this menu was open before
+	window = menu_windows.get((header, tuple(options), width), width, height+6, draw)
 
 	#blit the contents of "window" to the root console
 	x = SCREEN_WIDTH / 2 - width / 2
@@ -1215,10 +1473,11 @@ def menu(header, options, width):
 	libtcod.console_blit(window, 0, 0, width, height, 0, x, y, 1.0, 0.7)
 
 
-	#present the root console to the player and wait for a key-press
+	#present the root console to the player and wait for a key-press. only a press counts, not
+	#the release of the key that opened the menu, so one wait is enough
 	libtcod.console_flush()
-	key = libtcod.console_wait_for_keypress(True)
-	key = libtcod.console_wait_for_keypress(True)
+	key = libtcod.Key()
+	libtcod.sys_wait_for_event(libtcod.EVENT_KEY_PRESS, key, libtcod.Mouse(), True)
 
 	if key.vk == libtcod.KEY_ENTER and key.lalt:  #(special case) Alt+Enter: toggle fullscreen
 		libtcod.console_set_fullscreen(not libtcod.console_is_fullscreen)
@@ -1250,80 +1509,148 @@ def inventory_menu(header):
 
  
 def handle_keys():
-	global key
- 
+	global key, running
+ 
+	action = key_bindings.action(key)
+	if running == 'which way':
+		#the key after the run key gives the direction, any other key (escape too) calls it off
+		if key.vk == libtcod.KEY_NONE:
+			return 'didnt-take-turn'  #no key yet, keep asking
+		running = DIRECTIONS.get(action)
+		if running is None:
+			return 'didnt-take-turn'
+		start_run()
+		run_move(running)
+		return None
+
 	if key.vk == libtcod.KEY_ENTER and key.lalt:
 		#Alt+Enter: toggle fullscreen
 		libtcod.console_set_fullscreen(not libtcod.console_is_fullscreen())
- 
-	elif key.vk == libtcod.KEY_ESCAPE:
+
+	elif action == 'exit':
 		return 'exit'  #exit game
- 
+
 	if game_state == 'playing':
-		#movement keys
-		if key.vk == libtcod.KEY_UP or key.vk == libtcod.KEY_KP8:
-			player_move_or_attack(0, -1)
-		elif key.vk == libtcod.KEY_DOWN or key.vk == libtcod.KEY_KP2:
-			player_move_or_attack(0, 1)
-		elif key.vk == libtcod.KEY_LEFT or key.vk == libtcod.KEY_KP4:
-			player_move_or_attack(-1, 0)
-		elif key.vk == libtcod.KEY_RIGHT or key.vk == libtcod.KEY_KP6:
-			player_move_or_attack(1, 0)
-		elif key.vk == libtcod.KEY_HOME or key.vk == libtcod.KEY_KP7:
-			player_move_or_attack(-1, -1)
-		elif key.vk == libtcod.KEY_PAGEUP or key.vk == libtcod.KEY_KP9:
-			player_move_or_attack(1, -1)
-		elif key.vk == libtcod.KEY_END or key.vk == libtcod.KEY_KP1:
-			player_move_or_attack(-1, 1)
-		elif key.vk == libtcod.KEY_PAGEDOWN or key.vk == libtcod.KEY_KP3:
-			player_move_or_attack(1, 1)
-		elif key.vk == libtcod.KEY_KP5:
+		if action in DIRECTIONS:
+			(dx, dy) = DIRECTIONS[action]
+			player_move_or_attack(dx, dy)
+		elif action == 'wait':
 			pass  #do nothing ie wait for the monster to come to you
 		else:
-			#test for other keys
-			key_char = chr(key.c)
- 
-			if key_char == 'g':
-				#pick up an item
-				for object in objects:  #look for an item in the player's tile
-					if object.x == player.x and object.y == player.y and object.item:
-						object.item.pick_up()
-						break
- 
-			if key_char == 'i':
-				#show the inventory; if an item is selected, use it
-				chosen_item = inventory_menu('Press the key next to an item to use it, or any other to cancel.\n')
-				if chosen_item is not None:
-					chosen_item.use()
- 
-			if key_char == 'd':
-				#show the inventory; if an item is selected, drop it
-				chosen_item = inventory_menu('Press the key next to an item to drop it, or any other to cancel.\n')
-				if chosen_item is not None:
-					chosen_item.drop()
-
-			if key_char == 'j':
-				next_level()
- 
-			if key_char == 'c':
-				#show character information
-				level_up_xp = LEVEL_UP_BASE + player.level * LEVEL_UP_FACTOR
-				msgbox('Character Information\n\nLevel: ' + str(player.level) + '\nExperience: ' + str(player.fighter.xp) +
-					   '\nExperience to level up: ' + str(level_up_xp) + '\n\nMaximum HP: ' + str(player.fighter.max_hp) +
-					   '\nAttack: ' + str(player.fighter.power) + '\nDefense: ' + str(player.fighter.defense), CHARACTER_SCREEN_WIDTH)
- 
-			if key_char == '<':
-				#go down stairs, if the player is on them
-				if stairs.x == player.x and stairs.y == player.y:
-					next_level()
-
-			if key_char == '>':
-				#go down stairs, if the player is on them
-				if upstairs.x == player.x and upstairs.y == player.y:
-					past_level()
- 
+			command = COMMANDS.get(action)
+			if command is not None:
+				command()
 			return 'didnt-take-turn'
- 
+
+def pick_up_here():
+	#pick up an item
+	for object in objects:  #look for an item in the player's tile
+		if object.x == player.x and object.y == player.y and object.item:
+			object.item.pick_up()
+			break
+
+def use_from_inventory():
+	#show the inventory; if an item is selected, use it
+	chosen_item = inventory_menu('Press the key next to an item to use it, or any other to cancel.\n')
+	if chosen_item is not None:
+		chosen_item.use()
+
+def drop_from_inventory():
+	#show the inventory; if an item is selected, drop it
+	chosen_item = inventory_menu('Press the key next to an item to drop it, or any other to cancel.\n')
+	if chosen_item is not None:
+		chosen_item.drop()
+
+def show_character():
+	#show character information
+	level_up_xp = LEVEL_UP_BASE + player.level * LEVEL_UP_FACTOR
+	msgbox('Character Information\n\nLevel: ' + str(player.level) + '\nExperience: ' + str(player.fighter.xp) +
+		   '\nExperience to level up: ' + str(level_up_xp) + '\n\nMaximum HP: ' + str(player.fighter.max_hp) +
+		   '\nAttack: ' + str(player.fighter.power) + '\nDefense: ' + str(player.fighter.defense), CHARACTER_SCREEN_WIDTH)
+
+def take_stairs_down():
+	#go down stairs, if the player is on them
+	if stairs.x == player.x and stairs.y == player.y:
+		next_level()
+
+def take_stairs_up():
+	#go up stairs, if the player is on them
+	if upstairs is not None and upstairs.x == player.x and upstairs.y == player.y:
+		past_level()
+
+def ask_run_direction():
+	global running
+	running = 'which way'
+	message('Run which way?', libtcod.light_gray)
+
+def start_explore():
+	global running, explore_path
+	running = 'explore'
+	explore_path = None
+	start_run()
+
+def start_run():
+	#remember how things stood when the run began, to stop when they change
+	global run_from
+	run_from = (player.fighter.hp, game_msgs.added, noticed())
+
+def noticed():
+	#ids of the monsters and items in view
+	return set(obj.id for obj in fov.visible_objects(objects) if obj.fighter or obj.item)
+
+def run_steps():
+	#a few steps of a run, with the monsters' turns in between, before the screen is drawn again.
+	#the turn of the last step is left to play_game(), like any other action
+	action = run_step()
+	for i in range(RUN_STEPS_PER_FRAME - 1):
+		if action == 'didnt-take-turn' or not running or game_state != 'playing':
+			break
+		take_monster_turns()
+		update_fov()
+		action = run_step()
+	return action
+
+def run_step():
+	#one step of a run or of exploring. it stops on any key, when the way is blocked or when
+	#something comes up (a monster or an item in view, a message, getting hurt)
+	global running
+	(hp, added, seen) = run_from
+	if (key.vk != libtcod.KEY_NONE or player.fighter.hp < hp or game_msgs.added != added or
+			not noticed() <= seen):
+		running = None
+		return 'didnt-take-turn'
+
+	step = running
+	if running == 'explore':
+		step = explore_step()
+		if step is None:
+			running = None
+			message('There is nothing left to explore around here.', libtcod.light_gray)
+			return 'didnt-take-turn'
+	run_move(step)
+	return None
+
+def explore_step():
+	#the next step towards the nearest unexplored cell next to explored floor (see explore.py).
+	#the way there is only searched for again once that cell has been seen, or the path is used up
+	global explore_path
+	if explore_path is None or not explore_path[1] or explored.is_explored(*explore_path[0]):
+		explore_path = explore.path_to_frontier(player.x, player.y, fov_x, fov_y,
+			fov_x + fov_width - 1, fov_y + fov_height - 1, is_floor, explored.is_explored)
+		if explore_path is None:
+			return None
+	return explore_path[1].pop()
+
+def is_floor(x, y):
+	return not map[x][y].blocked
+
+def run_move(step):
+	global running
+	(x, y) = (player.x, player.y)
+	player_move_or_attack(step[0], step[1])
+	if (player.x, player.y) == (x, y):
+		running = None  #bumped into something
+
 def check_level_up():
 	#see if the player's experience is enough to level-up
 	level_up_xp = LEVEL_UP_BASE + player.level * LEVEL_UP_FACTOR
@@ -1366,12 +1693,13 @@ def monster_death(monster):
 			libtcod.orange)
 	monster.char = '%'
 	monster.color = libtcod.dark_red
+	free_tiles.unblock(monster.x, monster.y)
 	monster.blocks = False
 	monster.fighter = None
 	monster.ai = None
 	monster.name = 'remains of ' + monster.name
 	monster.send_to_back()
-	libtcod.map_set_properties(fov_map, monster.x, monster.y, True, True)
+	set_fov_properties(monster.x, monster.y, True, True)
 
 	for y in range(1,4):
 		n=random.randint(-1, 2)
@@ -1382,8 +1710,10 @@ def monster_death(monster):
 		else:
 			bloodcolour = libtcod.darkest_red
 		(x,y) = to_camera_coordinates(monster.x,monster.y)
-		libtcod.console_set_char_background(con, x, y-1, bloodcolour)
-		libtcod.console_set_char_background(con, x +1, y, bloodcolour)
+		if x is not None:
+			#on the tiles, so it stays until the map is painted again
+			map_tiles.fill_rect(x, y-1, 1, 1, back=bloodcolour)
+			map_tiles.fill_rect(x+1, y, 1, 1, back=bloodcolour)
 		y += 1
 
 def target_tile(max_range=None):
@@ -1401,7 +1731,7 @@ def target_tile(max_range=None):
 			return (None, None)  #cancel if the player right-clicked or pressed Escape
  
 		#accept the target if the player clicked in FOV, and in case a range is specified, if it's in that range
-		if (mouse.lbutton_pressed and libtcod.map_is_in_fov(fov_map, x, y) and
+		if (mouse.lbutton_pressed and in_fov(x, y) and
 				(max_range is None or player.distance(x, y) <= max_range)):
 			return (x, y)
  
@@ -1413,23 +1743,27 @@ def target_monster(max_range=None):
 			return None
  
 		#return the first clicked monster, otherwise continue looping
-		for obj in objects:
-			if obj.x == x and obj.y == y and obj.fighter and obj != player:
+		for obj in objects.with_fighter():
+			if obj.x == x and obj.y == y and obj != player:
 				return obj
  
 def closest_monster(max_range):
 	#find closest enemy, up to a maximum range, and in the player's FOV
-	closest_enemy = None
-	closest_dist = max_range + 1  #start with (slightly more than) maximum range
- 
-	for object in objects:
-		if object.fighter and not object == player and libtcod.map_is_in_fov(fov_map, object.x, object.y):
-			#calculate distance between this object and the player
-			dist = player.distance_to(object)
-			if dist < closest_dist:  #it's closer, so remember it
-				closest_enemy = object
-				closest_dist = dist
-	return closest_enemy
+	closest_id = None
+	closest_dist = (max_range + 1) ** 2  #start with (slightly more than) maximum range, squared
+ 
+	#straight off the world's arrays, and only for the entities that have a fighter and are in view
+	xs = objects.x
+	ys = objects.y
+	for id in fov.visible_ids(objects, objects.fighters.ids):
+		#calculate (squared) distance between this object and the player
+		dist = (xs[id] - player.x) ** 2 + (ys[id] - player.y) ** 2
+		if dist < closest_dist and id != player.id:  #it's closer, so remember it
+			closest_id = id
+			closest_dist = dist
+	if closest_id is None:
+		return None
+	return objects.entities[closest_id]
  
 def cast_heal():
 	#heal the player
@@ -1450,6 +1784,7 @@ def cast_lightning():
 	#zap it!
 	message('A lighting bolt strikes the ' + monster.name + ' with a loud thunder! The damage is '
 			+ str(LIGHTNING_DAMAGE) + ' hit points.', libtcod.light_blue)
+	make_noise(monster.x, monster.y, BLAST_NOISE_RADIUS)
 	monster.fighter.take_damage(LIGHTNING_DAMAGE)
  
 def cast_fireball():
@@ -1458,8 +1793,9 @@ def cast_fireball():
 	(x, y) = target_tile()
 	if x is None: return 'cancelled'
 	message('The fireball explodes, burning everything within ' + str(FIREBALL_RADIUS) + ' tiles!', libtcod.orange)
+	make_noise(x, y, BLAST_NOISE_RADIUS)
  
-	for obj in objects:  #damage every fighter in range, including the player
+	for obj in objects.with_fighter():  #damage every fighter in range, including the player
 		if obj.distance(x, y) <= FIREBALL_RADIUS and obj.fighter:
 			message('The ' + obj.name + ' gets burned for ' + str(FIREBALL_DAMAGE) + ' hit points.', libtcod.orange)
 			obj.fighter.take_damage(FIREBALL_DAMAGE)
@@ -1488,14 +1824,18 @@ def save_game():
 	file['game_msgs'] = game_msgs
 	file['game_state'] = game_state
 	file['dungeon_level'] = dungeon_level
+	file['fov_cache'] = fov_cache
+	file['explored'] = explored
 	file.close()
  
 def load_game():
 	#open the previously saved shelve and load the game data
-	global map, objects, player, stairs, inventory, game_msgs, game_state, dungeon_level
+	global map, objects, player, stairs, inventory, game_msgs, game_state, dungeon_level, MAP_WIDTH, MAP_HEIGHT, fov_cache, explored, theme
+	load_game_data()
  
 	file = shelve.open('savegame', 'r')
 	map = file['map']
+	(MAP_WIDTH, MAP_HEIGHT) = (len(map), len(map[0]))
 	objects = file['objects']
 	player = objects[file['player_index']]  #get index of player in objects list and access it
 	stairs = objects[file['stairs_index']]  #same for the stairs
@@ -1503,12 +1843,17 @@ def load_game():
 	game_msgs = file['game_msgs']
 	game_state = file['game_state']
 	dungeon_level = file['dungeon_level']
+	theme = THEMES['hub'] if dungeon_level == 1 else THEMES['derelict']
+	fov_cache = file.get('fov_cache')
+	explored = file.get('explored') or visibility.Explored(MAP_WIDTH, MAP_HEIGHT, chunks.CHUNK_SIZE)
 	file.close()
  
 	initialize_fov()
  
 def new_game():
 	global player, inventory, game_msgs, game_state, dungeon_level, dungeon_name
+	load_game_data()
+
 	#create object representing the player
 	fighter_component = Fighter(my_path=0, lastx=0, lasty=0,hp=500, defense=1, power=8, xp=0, flicker=0, death_function=player_death)
 	player = Object(20, 12, '@', 'player', libtcod.white, blocks=True, fighter=fighter_component)
@@ -1524,8 +1869,8 @@ def new_game():
 	game_state = 'playing'
 	inventory = []
  
-	#create the list of game messages and their colors, starts empty
-	game_msgs = []
+	#create the log of game messages and their colors, starts empty
+	game_msgs = messages.MessageLog(MSG_HISTORY)
  
 	#a warm welcoming message!
 	message('You awaken on a ship floating in space. It seems to be docked to something, and you notice the warning lights on the resource gauges are on.', libtcod.red)
@@ -1540,7 +1885,7 @@ def new_game():
 def next_level():
 	#advance to the next level
 	global dungeon_level, dungeon_name, player
-	global color_dark_wall, color_light_wall, color_dark_ground, color_light_ground
+	delete_paths()  #the level's objects are left behind, with the FOV map their paths were on
 	if dungeon_level == 1:
 		file = shelve.open('hub', 'n')
 		file['map'] = map
@@ -1548,14 +1893,10 @@ def next_level():
 		file['player_index'] = objects.index(player)
 		file['stairs_index'] = objects.index(stairs)  #same for the stairs
 		#file['upstairs_index'] = objects.index(upstairs)
+		file['fov_cache'] = fov_cache
+		file['explored'] = explored
 		file.close()
 
-		color_dark_wall = libtcod.Color(22, 22, 22)
-		color_light_wall = libtcod.Color(54, 54, 54)
-		color_dark_ground = libtcod.Color(48, 38, 38)
-		color_light_ground = libtcod.Color(86, 76, 76)
-
-		libtcod.namegen_parse('shipnames.txt')
 		shipname = libtcod.namegen_generate('shipnames')
 
 		dungeon_level += 1
@@ -1571,17 +1912,22 @@ def next_level():
 def past_level():
 	#advance to the next level
 	global dungeon_level, dungeon_name, map, objects, player, stairs, upstairs, inventory, game_msgs, game_state, dungeon_level
-	global color_dark_wall, color_light_wall, color_dark_ground, color_light_ground
+	global MAP_WIDTH, MAP_HEIGHT, fov_cache, explored, theme
 
+	delete_paths()
 	dungeon_level -= 1
 	if dungeon_level == 1:
 		file = shelve.open('hub', 'r')
 		map = file['map']
+		(MAP_WIDTH, MAP_HEIGHT) = (len(map), len(map[0]))
 		objects = file['objects']
 		player = objects[file['player_index']]
 		stairs = objects[file['stairs_index']]  #same for the stairs
 		#upstairs = objects[file['upstairs_index']]
+		fov_cache = file.get('fov_cache')
+		explored = file.get('explored') or visibility.Explored(MAP_WIDTH, MAP_HEIGHT, chunks.CHUNK_SIZE)
 		file.close()
+		theme = THEMES['hub']
 		dungeon_name = "Your Ship"
 		message('You climb through the airlock back into the ship')
 		initialize_fov()
@@ -1605,21 +1951,124 @@ def load_data():
 	libtcod.struct_add_property(monsterStruct, 'power', libtcod.TYPE_INT, True)
 	libtcod.struct_add_property(monsterStruct, 'xp', libtcod.TYPE_INT, True)
 	libtcod.struct_add_property(monsterStruct, 'death_function', libtcod.TYPE_STRING, True)
+	libtcod.struct_add_property(monsterStruct, 'speed', libtcod.TYPE_INT, False)
+	libtcod.struct_add_property(monsterStruct, 'sight', libtcod.TYPE_INT, False)
 	libtcod.parser_run(parser, os.path.join('data', 'monster_data.cfg'), MonsterDataListener())
 
 	libtcod.parser_delete(parser)
 
+#startup comes in phases, so the title screen shows up as soon as possible: the window, the
+#consoles and the menu background are all it needs. the monster data and the name grammars
+#wait for the first new_game() or load_game().
+def startup_phase(name, started):
+	#note how long a phase took since 'started' (a time.time()); printed out in DEBUG mode
+	took = time.time() - started
+	startup_times.append((name, took))
+	if DEBUG:
+		print 'startup: %-16s %7.1f ms' % (name, took * 1000)
+
+def init_window():
+	global con, panel, sidebar
+	started = time.time()
+	libtcod.console_set_custom_font('dejavu16x16.png', libtcod.FONT_TYPE_GRAYSCALE | libtcod.FONT_LAYOUT_TCOD)
+	#libtcod.console_set_custom_font('Bisasam20x20.png', libtcod.FONT_TYPE_GREYSCALE | libtcod.FONT_LAYOUT_ASCII_INROW)
+	libtcod.console_init_root(SCREEN_WIDTH, SCREEN_HEIGHT, 'A Scream in Space', False)
+	libtcod.sys_set_fps(LIMIT_FPS)
+	startup_phase('window', started)
+
+	started = time.time()
+	con = libtcod.console_new(CAMERA_WIDTH, CAMERA_HEIGHT)  #the map console only ever shows the camera's view
+	panel = libtcod.console_new(SCREEN_WIDTH, PANEL_HEIGHT)
+	sidebar = libtcod.console_new(SIDEBAR_WIDTH, SCREEN_HEIGHT)
+	startup_phase('consoles', started)
+
+def get_menu_background():
+	#the title screen drawn into a console the first time the menu shows, then kept: the image is
+	#only loaded and scaled once
+	global menu_background
+	if menu_background is None:
+		started = time.time()
+		menu_background = libtcod.console_new(SCREEN_WIDTH, SCREEN_HEIGHT)
+		img = libtcod.image_load('image.png')
+		#the background image, at twice the regular console resolution
+		libtcod.image_blit_2x(img, menu_background, 0, 0, 0, 0, w=-1, h=-1)
+		libtcod.image_delete(img)
+
+		#the game's title, and some credits!
+		libtcod.console_set_default_foreground(menu_background, libtcod.light_yellow)
+		libtcod.console_print_ex(menu_background, SCREEN_WIDTH/2, SCREEN_HEIGHT/2-4, libtcod.BKGND_NONE, libtcod.CENTER,
+								 'A Scream in Space')
+		libtcod.console_print_ex(menu_background, SCREEN_WIDTH/2, SCREEN_HEIGHT-2, libtcod.BKGND_NONE, libtcod.CENTER, 'By Hoim')
+		startup_phase('menu background', started)
+	return menu_background
+
+def load_game_data():
+	#the monster data, the ship name grammar and the key bindings, the first time a game starts or is loaded
+	global game_data_loaded
+	if game_data_loaded:
+		return
+	started = time.time()
+	load_data()
+	libtcod.namegen_parse('shipnames.txt')
+	key_bindings.load(os.path.join('data', 'keys.cfg'))
+	game_data_loaded = True
+	startup_phase('game data', started)
+
+def delete_paths():
+	#paths are computed on the FOV map, so they can't outlive it (nor the level they were made on)
+	for object in objects.with_fighter():
+		if object.fighter.my_path is not 0:
+			libtcod.path_delete(object.fighter.my_path)
+			object.fighter.my_path = 0
+
 def initialize_fov():
-	global fov_recompute, fov_map
+	global fov_recompute, fov_map, fov_x, fov_y, fov_width, fov_height, fov, free_tiles, lights, decorations
 	fov_recompute = True
+
+	#glyphs drawn over the tiles: the hub's come with its static map, generated levels have none
+	if isinstance(map, chunks.ChunkedMap):
+		decorations = {}
+	else:
+		decorations = dict(((x, y), char) for (x, y, char) in staticmaps.load('hubmap').glyphs)
+
+	#the FOV map covers the whole of a plain map, but only the loaded window of a chunked one
+	if isinstance(map, chunks.ChunkedMap):
+		(fov_x, fov_y, fov_width, fov_height) = map.active
+	else:
+		(fov_x, fov_y, fov_width, fov_height) = (0, 0, MAP_WIDTH, MAP_HEIGHT)
+
+	delete_paths()
+	if fov_map is not None:
+		libtcod.map_delete(fov_map)
+ 
+	#create the FOV map, according to the generated map, and the bitmap its results are copied to
+	fov_map = libtcod.map_new(fov_width, fov_height)
+	fov = visibility.Visibility(fov_x, fov_y, fov_width, fov_height, fov_cache)
+	glowing = []
+	for y in range(fov_height):
+		for x in range(fov_width):
+			tile = map[fov_x + x][fov_y + y]
+			libtcod.map_set_properties(fov_map, x, y, not tile.block_sight, not tile.blocked)
+			if tile.sludge:
+				glowing.append((fov_x + x, fov_y + y))
+
+	#cast the lights that never move over the same window, once
+	lights = lighting.LightMap(fov_x, fov_y, fov_width, fov_height)
+	for (x, y) in glowing:
+		lights.add_static(fov_map, lighting.Light(x, y, SLUDGE_LIGHT_RADIUS, SLUDGE_LIGHT_COLOR), FOV_ALGO)
+	for object in (stairs, upstairs):
+		if object is not None and object in objects:
+			color = (object.color.r, object.color.g, object.color.b)
+			lights.add_static(fov_map, lighting.Light(object.x, object.y, STAIRS_LIGHT_RADIUS, color), FOV_ALGO)
+
+	#index the free floor of the same window, then mark where the blocking objects stand
+	free_tiles = freetiles.FreeTileIndex()
+	free_tiles.add_area(map, fov_x, fov_y, fov_width, fov_height)
+	for object in objects:
+		if object.blocks:
+			free_tiles.block(object.x, object.y)
  
-	#create the FOV map, according to the generated map
-	fov_map = libtcod.map_new(MAP_WIDTH, MAP_HEIGHT)
-	for y in range(MAP_HEIGHT):
-		for x in range(MAP_WIDTH):
-			libtcod.map_set_properties(fov_map, x, y, not map[x][y].block_sight, not map[x][y].blocked)
- 
-	libtcod.console_clear(con)  #unexplored areas start black (which is the default background color)
+	map_tiles.clear()  #unexplored areas start black
  
 def play_game():
 	global key, mouse, camera_x, camera_y
@@ -1641,42 +2090,49 @@ def play_game():
 		#level up if needed
 		check_level_up()
  
-		#erase all objects at their old locations, before they move
-		#erase all objects at their old locations, before they move
-		for object in objects:
-			if object.fighter:
-				if object.fighter.flicker is not None:
-					flicker_all()
-			for object in objects:
-				object.clear()
-		for object in objects:
-			object.clear()
- 
-		#handle keys and exit game if needed
-		player_action = handle_keys()
+		#flash whoever just got hurt (flicker_all() handles every fighter at once)
+		for object in objects.with_fighter():
+			if object.fighter.flicker is not None:
+				flicker_all()
+				break
+
+		#handle keys and exit game if needed (or take the next steps of a run)
+		if running and running != 'which way':
+			player_action = run_steps()
+		else:
+			player_action = handle_keys()
 		if player_action == 'exit':
 			save_game()
 			break
  
 		#let monsters take their turn
 		if game_state == 'playing' and player_action != 'didnt-take-turn':
-			for object in objects:
-				if object.ai:
-					object.ai.take_turn()
+			take_monster_turns()
+
+def make_noise(x, y, radius):
+	#wake up the monsters within earshot
+	objects.schedule.wake_within(x, y, radius)
+
+def take_monster_turns():
+	#wake up whoever may have the player in sight, then let the time the player's action took
+	#pass: every awake actor acts as often as its speed allows in that time. the ones that
+	#wandered off past ACTIVITY_RADIUS are put to sleep instead, until the player comes back.
+	schedule = objects.schedule
+	schedule.wake_within(player.x, player.y, SIGHT_RADIUS)
+	fov.new_turn()
+
+	(xs, ys) = (objects.x, objects.y)
+	r2 = ACTIVITY_RADIUS ** 2
+	for id in schedule.advance(scheduler.action_time(player.fighter.speed)):
+		if (xs[id] - player.x) ** 2 + (ys[id] - player.y) ** 2 > r2:
+			schedule.sleep(id)
+		else:
+			objects.ai[id].take_turn()
  
 def main_menu():
-
-	img = libtcod.image_load('image.png')
- 
 	while not libtcod.console_is_window_closed():
-		#show the background image, at twice the regular console resolution
-		libtcod.image_blit_2x(img, 0, 0, 0, 0,0, w=-1, h=-1)
- 
-		#show the game's title, and some credits!
-		libtcod.console_set_default_foreground(0, libtcod.light_yellow)
-		libtcod.console_print_ex(0, SCREEN_WIDTH/2, SCREEN_HEIGHT/2-4, libtcod.BKGND_NONE, libtcod.CENTER,
-								 'A Scream in Space')
-		libtcod.console_print_ex(0, SCREEN_WIDTH/2, SCREEN_HEIGHT-2, libtcod.BKGND_NONE, libtcod.CENTER, 'By Hoim')
+		#show the background image with the game's title
+		libtcod.console_blit(get_menu_background(), 0, 0, SCREEN_WIDTH, SCREEN_HEIGHT, 0, 0, 0)
  
 		#show options and wait for the player's choice
 		choice = menu('', ['Play a new game', 'Continue last game', 'Quit'], 24)
@@ -1694,14 +2150,56 @@ def main_menu():
 		elif choice == 2:  #quit
 			break
 
-libtcod.console_set_custom_font('dejavu16x16.png', libtcod.FONT_TYPE_GRAYSCALE | libtcod.FONT_LAYOUT_TCOD)
-#libtcod.console_set_custom_font('Bisasam20x20.png', libtcod.FONT_TYPE_GREYSCALE | libtcod.FONT_LAYOUT_ASCII_INROW)
-libtcod.console_init_root(SCREEN_WIDTH, SCREEN_HEIGHT, 'A Scream in Space', False)
-libtcod.sys_set_fps(LIMIT_FPS)
-con = libtcod.console_new(MAP_WIDTH, MAP_HEIGHT)
-panel = libtcod.console_new(SCREEN_WIDTH, PANEL_HEIGHT)
-
-sidebar = libtcod.console_new(SIDEBAR_WIDTH, SCREEN_HEIGHT)
+fov_map = None
+fov = visibility.Visibility(0, 0, 0, 0)
+fov_cache = None
+explored = visibility.Explored(0, 0)
+decorations = {}  #(x, y) -> character code drawn over the tile there
+level_minimap = None
+panel_shown = None  #what the GUI panel was last printed with
+free_tiles = freetiles.FreeTileIndex()
+upstairs = None
+theme = THEMES['derelict']  #the map colors of the level
+lights = lighting.LightMap(0, 0, 0, 0)
+torch = lighting.Light(0, 0, TORCH_RADIUS, TORCH_COLOR, TORCH_LEAST)  #the player's
 monster_data = {}
-load_data()
-main_menu()
\ No newline at end of file
+game_data_loaded = False
+menu_background = None
+console_pool = overlays.ConsolePool(SPARE_CONSOLES)
+menu_windows = overlays.WindowCache(console_pool, MENU_WINDOWS)
+startup_times = []  #(phase, seconds) in the order they ran
+key_bindings = keys.KeyBindings(KEY_BINDINGS)
+running = None  #the direction the player is running in, 'which way' while asking, or 'explore'
+run_from = None
+explore_path = None  #(the unexplored cell being explored towards, the steps left to it)
+map_redraw = True  #the FOV changed since the map was last drawn
+map_tiles = consolebuffer.ConsoleBuffer(CAMERA_WIDTH, CAMERA_HEIGHT)  #the map as last painted, under the objects
+map_frame = consolebuffer.ConsoleBuffer(CAMERA_WIDTH, CAMERA_HEIGHT)
+glyphs = consolebuffer.DrawList()  #the objects' glyphs for this frame
+COMMANDS = {  #the actions that don't take a turn
+	'run': ask_run_direction,
+	'explore': start_explore,
+	'pick up': pick_up_here,
+	'inventory': use_from_inventory,
+	'drop': drop_from_inventory,
+	'skip level': next_level,
+	'history': show_history,
+	'overview': show_overview,
+	'character': show_character,
+	'stairs down': take_stairs_down,
+	'stairs up': take_stairs_up,
+	}
+
+if __name__ == '__main__':
+	launched = time.time()
+	init_window()
+	get_menu_background()
+	startup_phase('title screen', launched)
+	main_menu()
+
+	#free the overlays before the window goes
+	menu_windows.clear()
+	console_pool.clear()
+	libtcod.console_delete(menu_background)
+	if DEBUG and console_pool.out:
+		print 'consoles never given back: %d' % console_pool.out
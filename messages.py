@@ -0,0 +1,66 @@
+#the message log: a bounded ring buffer of messages, where the oldest drop off the far end once
+#it is full. each message keeps its word-wrapped lines per width, so they are only wrapped once,
+#and a message repeated straight away is folded into the last one ("... (x3)").
+import textwrap
+from collections import deque
+
+
+class Message:
+	def __init__(self, text, color):
+		self.text = text
+		self.color = color
+		self.count = 1  #how many times in a row it came up
+		self.wrapped = {}  #width -> wrapped lines
+
+	def lines(self, width):
+		lines = self.wrapped.get(width)
+		if lines is None:
+			text = self.text
+			if self.count > 1:
+				text += ' (x' + str(self.count) + ')'
+			lines = self.wrapped[width] = textwrap.wrap(text, width)
+		return lines
+
+
+class MessageLog:
+	def __init__(self, capacity):
+		self.messages = deque(maxlen=capacity)
+		self.dirty = True  #something changed since the panel was last drawn
+		self.added = 0  #messages added all in all, repeats included
+
+	def __len__(self):
+		return len(self.messages)
+
+	def __setstate__(self, state):
+		#a loaded log has never been drawn
+		self.__dict__.update(state)
+		self.dirty = True
+
+	def add(self, text, color):
+		self.added += 1
+		if self.messages:
+			last = self.messages[-1]
+			if last.text == text and last.color == color:
+				last.count += 1
+				last.wrapped.clear()
+				self.dirty = True
+				return
+		self.messages.append(Message(text, color))
+		self.dirty = True
+
+	def lines(self, width, height, scroll=0):
+		#the last 'height' lines (leaving out the 'scroll' newest ones) as (line, color), oldest
+		#first. only wraps the messages it gets to, newest first
+		wanted = height + scroll
+		lines = []
+		for message in reversed(self.messages):
+			for line in reversed(message.lines(width)):
+				lines.append((line, message.color))
+			if len(lines) >= wanted:
+				break
+		lines = lines[scroll:wanted]
+		lines.reverse()
+		return lines
+
+	def line_count(self, width):
+		return sum(len(message.lines(width)) for message in self.messages)
@@ -0,0 +1,51 @@
+#overview of a level for the sidebar (and the full-screen map): a small libtcod image with one
+#pixel per scale x scale block of map cells, drawn two pixels per console cell with
+#image_blit_2x. the scale is picked per level so the whole level fits the overview, however big
+#the level is, and the image never gets bigger than that. pixels are only painted for cells
+#explored since the last update, so keeping it current costs next to nothing.
+import libtcodpy as libtcod
+
+WALL = 1  #how much a cell counts when picking the color of its pixel
+FLOOR = 2
+
+
+class Minimap:
+	def __init__(self, explored, fit_width, fit_height, least_scale=1):
+		#fit_width x fit_height pixels must hold the whole level
+		self.explored = explored  #the visibility.Explored it shows
+		self.scale = max(least_scale, -(-explored.width // fit_width), -(-explored.height // fit_height))
+		self.width = -(-explored.width // self.scale)
+		self.height = -(-explored.height // self.scale)
+		self.image = libtcod.image_new(self.width, self.height)  #all black: nothing explored
+		self.ranks = bytearray(self.width * self.height)  #what each pixel shows so far
+		self.painted = 0  #how many pixels were painted
+
+	def paint(self, cells):
+		#cells is a list of (x, y, color, rank) in map coordinates. a pixel takes the color of the
+		#highest ranking cell of its block, so floors show through the walls around them
+		(image, ranks, scale, w) = (self.image, self.ranks, self.scale, self.width)
+		put_pixel = libtcod.image_put_pixel
+		for (x, y, color, rank) in cells:
+			(px, py) = (x // scale, y // scale)
+			if rank > ranks[py * w + px]:
+				ranks[py * w + px] = rank
+				put_pixel(image, px, py, color)
+				self.painted += 1
+
+	def draw(self, console, dx, dy, w, h, center_x, center_y, marker_color):
+		#blit the part of the minimap around the map cell (center_x, center_y) that fits in
+		#w x h console cells (2w x 2h pixels), with a marker on the center
+		pw = min(2 * w, self.width)
+		ph = min(2 * h, self.height)
+		(cx, cy) = (center_x // self.scale, center_y // self.scale)
+		sx = max(0, min(cx - pw // 2, self.width - pw))
+		sy = max(0, min(cy - ph // 2, self.height - ph))
+
+		image = self.image
+		under = libtcod.image_get_pixel(image, cx, cy)
+		libtcod.image_put_pixel(image, cx, cy, marker_color)
+		libtcod.image_blit_2x(image, console, dx, dy, sx, sy, pw, ph)
+		libtcod.image_put_pixel(image, cx, cy, under)
+
+	def delete(self):
+		libtcod.image_delete(self.image)
@@ -0,0 +1,90 @@
+#off-screen consoles for menus and other overlays. a ConsolePool hands them out by size and takes
+#them back for reuse, so opening overlays doesn't keep allocating native memory; a WindowCache
+#keeps the windows by what is drawn on them, so opening the same menu again only blits it.
+from collections import OrderedDict
+
+import libtcodpy as libtcod
+
+
+class ConsolePool:
+	#'out' counts the consoles handed out and not given back yet: if it keeps growing, something
+	#forgets to give() its consoles back
+	def __init__(self, spare):
+		self.spare = spare  #consoles of each size kept for reuse, the rest are deleted
+		self.free = {}  #(width, height) -> consoles ready to be handed out
+		self.sizes = {}  #console -> (width, height), for the ones handed out
+		self.out = 0
+		self.created = 0
+		self.reused = 0
+
+	def take(self, width, height):
+		#a cleared console of that size, with the default colors and alignment
+		free = self.free.get((width, height))
+		if free:
+			console = free.pop()
+			libtcod.console_set_default_background(console, libtcod.black)
+			libtcod.console_set_default_foreground(console, libtcod.white)
+			libtcod.console_set_alignment(console, libtcod.LEFT)
+			libtcod.console_clear(console)
+			self.reused += 1
+		else:
+			console = libtcod.console_new(width, height)
+			self.created += 1
+		self.sizes[console] = (width, height)
+		self.out += 1
+		return console
+
+	def give(self, console):
+		size = self.sizes.pop(console)
+		self.out -= 1
+		free = self.free.setdefault(size, [])
+		if len(free) < self.spare:
+			free.append(console)
+		else:
+			libtcod.console_delete(console)
+
+	def clear(self):
+		#delete the spare consoles; the ones handed out are their holders' to give back
+		for free in self.free.values():
+			for console in free:
+				libtcod.console_delete(console)
+		self.free.clear()
+
+	def stats(self):
+		#one line for the debug display
+		spare = sum(len(free) for free in self.free.values())
+		return '%d out, %d spare, %d made, %d reused' % (self.out, spare, self.created, self.reused)
+
+
+class WindowCache:
+	#the windows come from a ConsolePool and go back to it when they're dropped
+	def __init__(self, pool, capacity):
+		self.pool = pool
+		self.capacity = capacity
+		self.windows = OrderedDict()  #key -> console, least recently used first
+		self.hits = 0
+		self.misses = 0
+
+	def __len__(self):
+		return len(self.windows)
+
+	def get(self, key, width, height, draw):
+		#the console kept for 'key'; if there is none, a new width x height one drawn by draw(console).
+		#the key must cover everything draw() puts on it, size included
+		window = self.windows.pop(key, None)
+		if window is None:
+			self.misses += 1
+			if len(self.windows) >= self.capacity:
+				(old_key, old) = self.windows.popitem(last=False)
+				self.pool.give(old)
+			window = self.pool.take(width, height)
+			draw(window)
+		else:
+			self.hits += 1
+		self.windows[key] = window
+		return window
+
+	def clear(self):
+		for window in self.windows.values():
+			self.pool.give(window)
+		self.windows.clear()
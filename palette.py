@@ -0,0 +1,51 @@
+#colors made once. color(r, g, b) always hands back the same libtcod Color for the same
+#components, so changing level or drawing a frame doesn't allocate any, and a Theme -- the map
+#colors of a kind of level -- is built from plain data. themes also keep their colors as (r, g, b)
+#tuples for painting ConsoleBuffers, packed into one int each (0xRRGGBB) in an array('i'), and
+#as shade tables: the color of a wall or floor under every light level, channel by channel.
+from array import array
+
+import libtcodpy as libtcod
+
+_colors = {}  #(r, g, b) -> Color
+
+
+def color(r, g, b):
+	c = _colors.get((r, g, b))
+	if c is None:
+		c = _colors[(r, g, b)] = libtcod.Color(r, g, b)
+	return c
+
+
+def pack(c):
+	return c.r << 16 | c.g << 8 | c.b
+
+
+def unpack(rgb):
+	return color(rgb >> 16 & 255, rgb >> 8 & 255, rgb & 255)
+
+
+def shades(dark, light):
+	#for each channel, the value at each light level (0-255) from the dark color to the lit one
+	return tuple([d + (l - d) * level // 255 for level in range(256)] for (d, l) in zip(dark, light))
+
+
+class Theme:
+	SLOTS = ('dark_wall', 'light_wall', 'dark_ground', 'light_ground', 'sludge', 'space')
+
+	def __init__(self, **colors):
+		#a color for every slot, as (r, g, b) or a libtcod Color
+		for slot in self.SLOTS:
+			c = colors[slot]
+			if isinstance(c, tuple):
+				c = color(*c)
+			else:
+				c = color(c.r, c.g, c.b)
+			setattr(self, slot, c)
+		self.rgb = dict((slot, (c.r, c.g, c.b)) for (slot, c) in self.colors())
+		self.packed = array('i', [pack(c) for (slot, c) in self.colors()])  #in SLOTS order
+		self.shades = {'wall': shades(self.rgb['dark_wall'], self.rgb['light_wall']),
+					   'ground': shades(self.rgb['dark_ground'], self.rgb['light_ground'])}
+
+	def colors(self):
+		return [(slot, getattr(self, slot)) for slot in self.SLOTS]
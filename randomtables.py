@@ -0,0 +1,93 @@
+#weighted random tables, compiled into alias tables (Vose's method) for O(1) draws. draws come
+#from a libtcod random generator, the game's default one unless told otherwise, like every other
+#roll in the game.
+import libtcodpy as libtcod
+
+
+class AliasTable:
+	def __init__(self, chances):
+		#chances is a dict of option -> weight; options with no weight can never come up
+		self.options = [option for option in sorted(chances) if chances[option] > 0]
+		n = len(self.options)
+		self.prob = [1.0] * n
+		self.alias = list(range(n))
+		if n == 0:
+			return
+
+		#scale the weights so the average is 1, then pair every short column with a tall one
+		total = float(sum(chances[option] for option in self.options))
+		scaled = [chances[option] * n / total for option in self.options]
+		small = [i for i in range(n) if scaled[i] < 1.0]
+		large = [i for i in range(n) if scaled[i] >= 1.0]
+		while small and large:
+			s = small.pop()
+			l = large.pop()
+			self.prob[s] = scaled[s]
+			self.alias[s] = l
+			scaled[l] -= 1.0 - scaled[s]
+			if scaled[l] < 1.0:
+				small.append(l)
+			else:
+				large.append(l)
+		#whatever is left over is full (up to rounding errors)
+		for i in small + large:
+			self.prob[i] = 1.0
+
+	def __len__(self):
+		return len(self.options)
+
+	def choice(self, rng=0):
+		#one weighted draw, or None if the table is empty
+		if not self.options:
+			return None
+		column = libtcod.random_get_int(rng, 0, len(self.options) - 1)
+		if libtcod.random_get_float(rng, 0.0, 1.0) < self.prob[column]:
+			return self.options[column]
+		return self.options[self.alias[column]]
+
+	def sample(self, count, rng=0):
+		#'count' independent draws at once
+		if not self.options:
+			return []
+		options = self.options
+		prob = self.prob
+		alias = self.alias
+		last = len(options) - 1
+		get_int = libtcod.random_get_int
+		get_float = libtcod.random_get_float
+		result = []
+		for draw in range(count):
+			column = get_int(rng, 0, last)
+			result.append(options[column] if get_float(rng, 0.0, 1.0) < prob[column] else options[alias[column]])
+		return result
+
+
+def from_level(table, level):
+	#the value a [[value, level], ...] table gives at a level: the last entry reached, or 0
+	for (value, min_level) in reversed(table):
+		if level >= min_level:
+			return value
+	return 0
+
+
+class LevelTables:
+	#a set of weighted tables, compiled once for each level they're asked for
+	def __init__(self, tables):
+		#tables is a dict of name -> {option: weight, or [[weight, level], ...]}
+		self.tables = tables
+		self.compiled = {}
+
+	def at_level(self, level):
+		#dict of name -> AliasTable for this level
+		compiled = self.compiled.get(level)
+		if compiled is None:
+			compiled = {}
+			for (name, table) in self.tables.items():
+				chances = {}
+				for (option, weight) in table.items():
+					if isinstance(weight, list):
+						weight = from_level(weight, level)
+					chances[option] = weight
+				compiled[name] = AliasTable(chances)
+			self.compiled[level] = compiled
+		return compiled
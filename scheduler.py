@@ -0,0 +1,117 @@
+#turn order for the actors of a level.
+#every actor that is awake has one entry in a priority queue, keyed by the time of its next
+#action; acting costs TURN_TIME at normal speed, less for fast actors and more for slow ones.
+#the queue only ever holds actors, so a turn costs O(log n) in the number of awake actors no
+#matter how many items, corpses and bits of furniture share the level. sleeping actors are
+#out of the queue altogether until something wakes them up, filed by where they lie so that
+#waking up the ones near a spot only looks at that part of the level.
+import heapq
+
+NORMAL_SPEED = 100
+TURN_TIME = 100  #time an action takes at normal speed
+SLEEP_BUCKET = 16  #size of the squares sleeping actors are filed by
+
+
+def action_time(speed):
+	#how long one action takes at the given speed
+	return TURN_TIME * NORMAL_SPEED // max(speed, 1)
+
+
+class Scheduler:
+	def __init__(self, speed_of, position_of):
+		self.speed_of = speed_of  #function: entity id -> speed
+		self.position_of = position_of  #function: entity id -> (x, y)
+		self.now = 0
+		self.queue = []  #heap of (time, ticket, id); entries whose ticket is out of date are skipped
+		self.tickets = {}  #id -> ticket of its live queue entry, for the actors that are awake
+		self.asleep = {}  #id -> bucket, for the actors that are asleep (they don't move)
+		self.buckets = {}  #(x, y) / SLEEP_BUCKET -> ids asleep in that square
+		self.next_ticket = 0  #also breaks ties: first scheduled, first to act
+
+		#how many actions were simulated: in the last turn, the busiest turn, and all in all
+		self.acted = 0
+		self.busiest = 0
+		self.actions = 0
+		self.turns = 0
+
+	def __len__(self):
+		return len(self.tickets)
+
+	def __contains__(self, id):
+		return id in self.tickets or id in self.asleep
+
+	def add(self, id, delay=0):
+		#(re)schedule an actor to act 'delay' from now, waking it up if it was asleep
+		self._unfile(id)
+		self.next_ticket += 1
+		self.tickets[id] = self.next_ticket
+		heapq.heappush(self.queue, (self.now + delay, self.next_ticket, id))
+
+	def remove(self, id):
+		#the actor lost its AI or left the level. its queue entry just goes stale
+		self.tickets.pop(id, None)
+		self._unfile(id)
+
+	def sleep(self, id):
+		if id in self.tickets:
+			del self.tickets[id]
+			(x, y) = self.position_of(id)
+			bucket = (x // SLEEP_BUCKET, y // SLEEP_BUCKET)
+			self.asleep[id] = bucket
+			self.buckets.setdefault(bucket, set()).add(id)
+
+	def wake(self, id):
+		if id in self.asleep:
+			self.add(id)
+
+	def wake_within(self, x, y, radius):
+		#wake up the actors asleep within 'radius' of (x, y), looking only at the squares in reach
+		r2 = radius ** 2
+		for bx in range((x - radius) // SLEEP_BUCKET, (x + radius) // SLEEP_BUCKET + 1):
+			for by in range((y - radius) // SLEEP_BUCKET, (y + radius) // SLEEP_BUCKET + 1):
+				ids = self.buckets.get((bx, by))
+				if not ids:
+					continue
+				for id in list(ids):
+					(ix, iy) = self.position_of(id)
+					if (ix - x) ** 2 + (iy - y) ** 2 <= r2:
+						self.add(id)
+
+	def is_asleep(self, id):
+		return id in self.asleep
+
+	def _unfile(self, id):
+		bucket = self.asleep.pop(id, None)
+		if bucket is not None:
+			ids = self.buckets[bucket]
+			ids.discard(id)
+			if not ids:
+				del self.buckets[bucket]
+
+	def advance(self, time):
+		#let 'time' pass, yielding the ids of the actors due in that time in the order they act.
+		#each one is booked for its next action before it's yielded, so it can die, fall asleep
+		#or be slowed down during its turn and the queue stays right.
+		until = self.now + time
+		queue = self.queue
+		tickets = self.tickets
+		self.acted = 0
+		while queue and queue[0][0] < until:
+			(due, ticket, id) = heapq.heappop(queue)
+			if tickets.get(id) != ticket:
+				continue
+			self.now = due
+			self.add(id, action_time(self.speed_of(id)))
+			self.acted += 1
+			yield id
+		self.now = until
+
+		self.turns += 1
+		self.actions += self.acted
+		self.busiest = max(self.busiest, self.acted)
+
+	def stats(self):
+		#one line about the work done, for the debug display
+		average = self.actions / float(max(self.turns, 1))
+		return 'acted %d (avg %.1f, max %d), awake %d, asleep %d' % (
+			self.acted, average, self.busiest, len(self.tickets), len(self.asleep))
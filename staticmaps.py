@@ -0,0 +1,119 @@
+#hand-made maps, compiled once into a binary cache.
+#every layout in maps.py (any list of strings) and every text file in data/maps is a static
+#map, loaded by name: load('hubmap'). the cache is rebuilt whenever a layout changes.
+import os
+import zlib
+try:
+	import cPickle as pickle
+except ImportError:
+	import pickle
+
+import maps
+
+CACHE_FILE = os.path.join('data', 'staticmaps.cache')
+CACHE_FORMAT = 3  #bumped whenever what's cached changes, so old caches get rebuilt
+MAPS_DIR = os.path.join('data', 'maps')
+
+#tile codes, and the Tile(blocked, sludge, bar, door, space) arguments for each
+WALL, FLOOR, SLUDGE, BAR, DOOR, SPACE = range(6)
+TILE_ARGS = [
+	(True, False, False, False, False),
+	(False, False, False, False, False),
+	(False, True, False, False, False),
+	(False, False, True, False, False),
+	(False, False, False, True, False),
+	(False, False, False, False, True),
+]
+CHAR_CODES = {' ': FLOOR, '~': SLUDGE, '_': BAR, 'X': DOOR, 'W': SPACE}  #anything else is wall
+GLYPHS = {SLUDGE: 172, SPACE: 171}  #decorations drawn on top of some tiles
+
+_cache = None
+
+
+class StaticMap:
+	def __init__(self, name, width, height, codes, glyphs):
+		self.name = name
+		self.width = width
+		self.height = height
+		self.codes = codes  #one tile code per cell, column by column (x * height + y)
+		self.glyphs = glyphs  #(x, y, char) for the decorated cells, drawn over the tiles by render_all()
+
+	def build(self, tile_class):
+		#fresh tiles for a level, indexed [x][y] like any other map
+		codes = self.codes
+		h = self.height
+		return [[tile_class(*TILE_ARGS[codes[x * h + y]]) for y in range(h)]
+				for x in range(self.width)]
+
+
+def _sources():
+	#every layout we know about, by name
+	sources = {}
+	for name in dir(maps):
+		layout = getattr(maps, name)
+		if isinstance(layout, list) and layout and all(isinstance(row, str) for row in layout):
+			sources[name] = layout
+	if os.path.isdir(MAPS_DIR):
+		for filename in sorted(os.listdir(MAPS_DIR)):
+			(name, ext) = os.path.splitext(filename)
+			if ext == '.txt':
+				with open(os.path.join(MAPS_DIR, filename)) as f:
+					sources[name] = f.read().splitlines()
+	return sources
+
+
+def _signature(sources):
+	crc = CACHE_FORMAT
+	for name in sorted(sources):
+		crc = zlib.crc32(name.encode('ascii'), crc)
+		crc = zlib.crc32('\n'.join(sources[name]).encode('ascii'), crc)
+	return crc
+
+
+def compile_layout(name, layout):
+	height = len(layout)
+	width = max(len(row) for row in layout)
+	codes = bytearray(width * height)  #WALL is 0, so short rows are padded with wall
+	glyphs = []
+	for y, row in enumerate(layout):
+		for x, char in enumerate(row):
+			code = CHAR_CODES.get(char, WALL)
+			codes[x * height + y] = code
+			if code in GLYPHS:
+				glyphs.append((x, y, GLYPHS[code]))
+	return StaticMap(name, width, height, codes, glyphs)
+
+
+def _load_cache():
+	global _cache
+	sources = _sources()
+	signature = _signature(sources)
+
+	#one read for the whole cache; a stale or broken one is simply rebuilt
+	try:
+		with open(CACHE_FILE, 'rb') as f:
+			(cached_signature, compiled) = pickle.loads(f.read())
+		if cached_signature == signature:
+			_cache = compiled
+			return
+	except Exception:
+		pass
+
+	_cache = dict((name, compile_layout(name, layout)) for (name, layout) in sources.items())
+	try:
+		with open(CACHE_FILE, 'wb') as f:
+			f.write(pickle.dumps((signature, _cache), 2))
+	except IOError:
+		pass  #read-only install: just keep the compiled maps in memory
+
+
+def names():
+	if _cache is None:
+		_load_cache()
+	return sorted(_cache)
+
+
+def load(name):
+	if _cache is None:
+		_load_cache()
+	return _cache[name]
@@ -0,0 +1,240 @@
+#the player's field of view, read out of the libtcod FOV map once per computation.
+#libtcod answers one cell per call (through ctypes), so rather than asking it about every tile
+#and object every frame, the cells that can be in view -- the ones within the light radius --
+#are copied into a bitmap right after map_compute_fov(). every check after that is a lookup.
+#line of sight is symmetric, so the same computation also tells which monsters have the player
+#in sight (up to a sight radius that can go past the light), without an FOV of their own.
+import libtcodpy as libtcod
+
+LIT = 1  #in the player's view
+IN_SIGHT = 2  #in line of sight of the player, but too far to be lit
+
+
+class Visibility:
+	def __init__(self, x0, y0, width, height, cache=None):
+		#the window of the map the FOV map covers, in map coordinates
+		self.x0 = x0
+		self.y0 = y0
+		self.width = width
+		self.height = height
+		self.cells = bytearray(width * height)  #row by row, LIT, IN_SIGHT or 0
+		self.lit = []  #indices of the cells in line of sight
+		self.cache = cache  #a FovCache, for maps whose walls never change
+		self.computed = 0  #how many times the FOV was computed
+		self.cached = 0  #and how many times it came from the cache instead
+		self.sightings = {}  #entity id -> (x, y, in sight, squared distance), for this turn
+
+	def compute(self, fov_map, x, y, light_radius, sight_radius, light_walls, algo):
+		#compute the FOV from (x, y) out to the sight radius and copy it out, clearing only what
+		#was in sight before. cells past the light radius are in sight but not lit.
+		radius = max(light_radius, sight_radius)
+		(x, y) = (x - self.x0, y - self.y0)
+		w = self.width
+		self.sightings.clear()
+
+		#on a map whose walls never change, the result for this spot may be known already
+		lit = None
+		if self.cache is not None and radius > 0:
+			lit = self.cache.get(x, y, w, (radius, light_walls, algo))
+		if lit is None:
+			lit = self._compute(fov_map, x, y, radius, light_walls, algo)
+			if self.cache is not None and radius > 0:
+				self.cache.put(x, y, w, lit)
+		else:
+			self.cached += 1
+
+		cells = self.cells
+		for i in self.lit:
+			cells[i] = 0
+		light = light_radius ** 2
+		for i in lit:
+			if light_radius >= radius or (i % w - x) ** 2 + (i // w - y) ** 2 <= light:
+				cells[i] = LIT
+			else:
+				cells[i] = IN_SIGHT
+		self.lit = lit
+
+	def _compute(self, fov_map, x, y, radius, light_walls, algo):
+		#the window indices of the cells in sight, asking libtcod only about the ones that can be:
+		#nothing past the radius is (a radius of 0 means no limit)
+		libtcod.map_compute_fov(fov_map, x, y, radius, light_walls, algo)
+		self.computed += 1
+
+		(left, top, right, bottom) = (0, 0, self.width - 1, self.height - 1)
+		if radius > 0:
+			(left, top) = (max(left, x - radius), max(top, y - radius))
+			(right, bottom) = (min(right, x + radius), min(bottom, y + radius))
+
+		lit = []
+		is_in_fov = libtcod.map_is_in_fov
+		w = self.width
+		for wy in range(top, bottom + 1):
+			row = wy * w
+			for wx in range(left, right + 1):
+				if is_in_fov(fov_map, wx, wy):
+					lit.append(row + wx)
+		return lit
+
+	def visible(self, x, y):
+		x -= self.x0
+		y -= self.y0
+		if x < 0 or y < 0 or x >= self.width or y >= self.height:
+			return False
+		return self.cells[y * self.width + x] == LIT
+
+	def new_turn(self):
+		self.sightings.clear()
+
+	def sight(self, world, id, x, y):
+		#(is there a line of sight, squared distance) between an entity and the point (x, y) the
+		#FOV was computed from. worked out once per turn and position of the entity.
+		(ex, ey) = (world.x[id], world.y[id])
+		known = self.sightings.get(id)
+		if known is not None and known[0] == ex and known[1] == ey:
+			return (known[2], known[3])
+
+		(cx, cy) = (ex - self.x0, ey - self.y0)
+		seen = (0 <= cx < self.width and 0 <= cy < self.height and
+				self.cells[cy * self.width + cx] != 0)
+		dist = (ex - x) ** 2 + (ey - y) ** 2
+		self.sightings[id] = (ex, ey, seen, dist)
+		return (seen, dist)
+
+	def visible_ids(self, world, ids):
+		#those of the given entity ids that stand in view, straight off the world's arrays
+		(xs, ys) = (world.x, world.y)
+		(x0, y0, w, h) = (self.x0, self.y0, self.width, self.height)
+		cells = self.cells
+		seen = []
+		for id in ids:
+			(x, y) = (xs[id] - x0, ys[id] - y0)
+			if 0 <= x < w and 0 <= y < h and cells[y * w + x] == LIT:
+				seen.append(id)
+		return seen
+
+	def visible_objects(self, world):
+		#the objects in view, in drawing order
+		(xs, ys) = (world.x, world.y)
+		(x0, y0, w, h) = (self.x0, self.y0, self.width, self.height)
+		cells = self.cells
+		seen = []
+		for obj in world:
+			(x, y) = (xs[obj.id] - x0, ys[obj.id] - y0)
+			if 0 <= x < w and 0 <= y < h and cells[y * w + x] == LIT:
+				seen.append(obj)
+		return seen
+
+
+class FovCache:
+	#FOV results by the spot they were computed from, for a map whose walls never change (the
+	#hub), so walking around it costs a lookup instead of a shadowcast. each result is a bitset
+	#over the square of the FOV radius around the spot, 37 bytes for a radius of 8.
+	#results are only good for one FOV window; clear() it if a wall ever changes.
+	def __init__(self):
+		self.settings = None  #(radius, light walls, algorithm) of the results
+		self.results = {}  #(x, y) in the window -> bitset, as a string of bytes
+
+	def __len__(self):
+		return len(self.results)
+
+	def clear(self):
+		self.results.clear()
+
+	def get(self, x, y, width, settings):
+		#window indices (for a window 'width' wide) of the cells in sight from (x, y), or None
+		if settings != self.settings:
+			self.settings = settings
+			self.results.clear()
+		bits = self.results.get((x, y))
+		if bits is None:
+			return None
+
+		radius = settings[0]
+		side = 2 * radius + 1
+		lit = []
+		for (byte_index, byte) in enumerate(bytearray(bits)):
+			if byte:
+				for bit in range(8):
+					if byte >> bit & 1:
+						n = byte_index * 8 + bit
+						lit.append((y + n // side - radius) * width + x + n % side - radius)
+		return lit
+
+	def put(self, x, y, width, lit):
+		#remember the result of a computation made with the settings last passed to get()
+		radius = self.settings[0]
+		side = 2 * radius + 1
+		bits = bytearray((side * side + 7) // 8)
+		for i in lit:
+			n = (i // width - y + radius) * side + i % width - x + radius
+			bits[n >> 3] |= 1 << (n & 7)
+		self.results[(x, y)] = bytes(bits)
+
+
+class Explored:
+	#the cells the player has seen, one bit each, kept per block of size x size cells (the same
+	#blocks as the map's chunks). a block's bits are only allocated once something in it has been
+	#seen, so a derelict costs 128 bytes per 32x32 chunk explored however big it is, in memory and
+	#in saved games. updated from the FOV bitmap after every computation, whether or not the map
+	#gets redrawn, for the map display, the minimap and saved games.
+	def __init__(self, width, height, size=32):
+		self.width = width
+		self.height = height
+		self.size = size
+		self.blocks = {}  #(bx, by) -> bytearray, row by row within the block
+		self.count = 0  #how many cells have been explored
+		self.fresh = []  #cells explored since the last take_fresh(), for the minimap
+
+	def __getstate__(self):
+		state = self.__dict__.copy()
+		state['fresh'] = []
+		return state
+
+	def is_explored(self, x, y):
+		size = self.size
+		block = self.blocks.get((x // size, y // size))
+		if block is None:
+			return False
+		n = (y % size) * size + x % size
+		return block[n >> 3] >> (n & 7) & 1 == 1
+
+	def cells(self):
+		#(x, y) of every explored cell
+		size = self.size
+		cells = []
+		for ((bx, by), block) in self.blocks.items():
+			for (i, byte) in enumerate(block):
+				if byte:
+					for bit in range(8):
+						if byte >> bit & 1:
+							n = i * 8 + bit
+							cells.append((bx * size + n % size, by * size + n // size))
+		return cells
+
+	def take_fresh(self):
+		fresh = self.fresh
+		self.fresh = []
+		return fresh
+
+	def add_view(self, view):
+		#OR the lit cells of a Visibility into the blocks; only those can have changed
+		blocks = self.blocks
+		cells = view.cells
+		fresh = self.fresh
+		before = len(fresh)
+		(size, vw, x0, y0) = (self.size, view.width, view.x0, view.y0)
+		(key, block) = (None, None)
+		for i in view.lit:
+			if cells[i] == LIT:
+				(x, y) = (x0 + i % vw, y0 + i // vw)
+				if (x // size, y // size) != key:
+					key = (x // size, y // size)
+					block = blocks.get(key)
+					if block is None:
+						block = blocks[key] = bytearray((size * size + 7) // 8)
+				n = (y % size) * size + x % size
+				mask = 1 << (n & 7)
+				if not block[n >> 3] & mask:
+					block[n >> 3] |= mask
+					fresh.append((x, y))
+		self.count += len(fresh) - before